@@ -0,0 +1,118 @@
+import contextlib
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+import metrics
+
+FLOWISE_MAX_IN_FLIGHT = int(os.environ.get('FLOWISE_MAX_IN_FLIGHT', 8))
+
+
+class AdmissionController:
+    """Caps in-flight Flowise predictions and admits waiting requests round-robin per user.
+
+    Each user has their own FIFO queue and users take turns, so a student who
+    sends many messages only ever holds one place in each round.
+    """
+
+    def __init__(self, max_in_flight: int = FLOWISE_MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._cond = threading.Condition()
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+    def _is_next(self, ticket) -> bool:
+        if self.in_flight >= self.max_in_flight or not self._queues:
+            return False
+        return next(iter(self._queues.values()))[0] is ticket
+
+    def _position(self, user: str, ticket) -> int:
+        """1-based place of ``ticket`` in the round-robin admission order."""
+        index = self._queues[user].index(ticket)
+        ahead = 0
+        before_user = True
+        for other, queue in self._queues.items():
+            if other == user:
+                before_user = False
+                continue
+            ahead += min(len(queue), index)
+            if before_user and len(queue) > index:
+                ahead += 1
+        return ahead + index + 1
+
+    def _update_gauges(self) -> None:
+        metrics.registry.set_gauge('flowise_in_flight', self.in_flight)
+        metrics.registry.set_gauge('flowise_queue_depth', sum(len(q) for q in self._queues.values()))
+
+    @contextlib.contextmanager
+    def admit(self, user: str, on_wait: Optional[Callable[[int], None]] = None, poll_interval: float = 0.5):
+        """Block until a prediction slot is free for ``user``.
+
+        ``on_wait(position)`` is called from the waiting thread whenever the
+        queue position changes, so it can update the UI.
+        """
+        ticket = object()
+        started = time.monotonic()
+        last_position = None
+
+        with self._cond:
+            self._queues.setdefault(user, deque()).append(ticket)
+            self._update_gauges()
+
+        try:
+            while True:
+                with self._cond:
+                    if self._is_next(ticket):
+                        queue = self._queues[user]
+                        queue.popleft()
+                        if queue:
+                            # The user's next message waits for everyone else's turn
+                            self._queues.move_to_end(user)
+                        else:
+                            del self._queues[user]
+                        self.in_flight += 1
+                        self._update_gauges()
+                        break
+                    position = self._position(user, ticket)
+
+                if on_wait is not None and position != last_position:
+                    on_wait(position)
+                last_position = position
+
+                with self._cond:
+                    if not self._is_next(ticket):
+                        self._cond.wait(poll_interval)
+        except BaseException:
+            with self._cond:
+                queue = self._queues.get(user)
+                if queue is not None and ticket in queue:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._queues[user]
+                self._update_gauges()
+                self._cond.notify_all()
+            raise
+
+        waited = time.monotonic() - started
+        metrics.registry.observe('flowise_queue_wait_seconds', waited, queued='yes' if last_position else 'no')
+
+        try:
+            yield waited
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._update_gauges()
+                self._cond.notify_all()
+
+
+_controller = AdmissionController()
+
+
+def get_admission_controller() -> AdmissionController:
+    return _controller
@@ -0,0 +1,158 @@
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from pyairtable import Api
+
+import metrics
+
+# Airtable allows 5 requests per second per base
+AIRTABLE_RATE_LIMIT = float(os.environ.get('AIRTABLE_RATE_LIMIT', 5))
+AIRTABLE_BURST = float(os.environ.get('AIRTABLE_BURST', 5))
+AIRTABLE_MAX_RETRIES = int(os.environ.get('AIRTABLE_MAX_RETRIES', 5))
+AIRTABLE_BACKOFF_FACTOR = float(os.environ.get('AIRTABLE_BACKOFF_FACTOR', 1.0))
+
+# Lower value is served first
+PRIORITY_LOGIN = 0
+PRIORITY_READ = 1
+PRIORITY_WRITE = 2
+
+PRIORITY_NAMES = {PRIORITY_LOGIN: 'login', PRIORITY_READ: 'read', PRIORITY_WRITE: 'write'}
+
+_priority = contextvars.ContextVar('airtable_priority', default=PRIORITY_READ)
+
+
+@contextlib.contextmanager
+def airtable_priority(priority: int):
+    """Run the enclosed Airtable calls at ``priority``."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class AirtableRateLimiter:
+    """Process-wide token bucket shared by every Airtable request, served in priority order.
+
+    A 429 pauses the whole bucket for ``Retry-After`` seconds (or an
+    exponential backoff when the header is missing), since the limit applies
+    to the base rather than to a single session.
+    """
+
+    def __init__(
+        self,
+        rate: float = AIRTABLE_RATE_LIMIT,
+        burst: float = AIRTABLE_BURST,
+        max_retries: int = AIRTABLE_MAX_RETRIES,
+        backoff_factor: float = AIRTABLE_BACKOFF_FACTOR
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.throttled = 0
+        self.requests = 0
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._waiters)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'queue_depth': len(self._waiters),
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'blocked_for': max(0.0, self._blocked_until - time.monotonic()),
+            }
+
+    def acquire(self, priority: int = PRIORITY_READ) -> None:
+        ticket = (priority, next(self._sequence))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            metrics.registry.set_gauge('airtable_queue_depth', len(self._waiters))
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+                self._refilled_at = now
+
+                if self._waiters[0] == ticket and now >= self._blocked_until and self._tokens >= 1:
+                    heapq.heappop(self._waiters)
+                    self._tokens -= 1
+                    self.requests += 1
+                    metrics.registry.set_gauge('airtable_queue_depth', len(self._waiters))
+                    # Let the next waiter re-check now that the head changed
+                    self._cond.notify_all()
+                    break
+
+                if self._waiters[0] == ticket:
+                    timeout = max(self._blocked_until - now, (1 - self._tokens) / self.rate, 0.001)
+                else:
+                    timeout = None
+                self._cond.wait(timeout)
+
+        metrics.registry.observe('airtable_queue_wait_seconds', time.monotonic() - started, priority=PRIORITY_NAMES.get(priority, priority))
+
+    def block_for(self, seconds: float) -> None:
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def call(self, priority: int, fn, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority)
+            try:
+                return fn(*args, **kwargs)
+            except requests.HTTPError as e:
+                response = e.response
+                if response is None or response.status_code != 429 or attempt == self.max_retries:
+                    raise
+                with self._cond:
+                    self.throttled += 1
+                metrics.registry.inc('airtable_throttled_total')
+                self.block_for(self._retry_delay(response, attempt))
+
+    def _retry_delay(self, response: requests.Response, attempt: int) -> float:
+        retry_after = response.headers.get('Retry-After')
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            delay = self.backoff_factor * (2 ** attempt)
+            return delay + random.uniform(0, delay / 2)
+
+
+_limiter = AirtableRateLimiter()
+
+
+def get_airtable_limiter() -> AirtableRateLimiter:
+    return _limiter
+
+
+class RateLimitedApi(Api):
+    """pyairtable ``Api`` whose every HTTP request goes through the shared limiter.
+
+    pyairtable's own 429 retries are disabled so backoff is coordinated here.
+    """
+
+    def __init__(self, api_key: str, *, limiter: Optional[AirtableRateLimiter] = None, **kwargs):
+        kwargs.setdefault('retry_strategy', None)
+        super().__init__(api_key, **kwargs)
+        self.limiter = limiter or get_airtable_limiter()
+
+    def request(self, method, url, *args, **kwargs):
+        return self.limiter.call(_priority.get(), super().request, method, url, *args, **kwargs)
@@ -0,0 +1,112 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import metrics
+
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'false').lower() == 'true'
+ANSWER_CACHE_TTL = float(os.environ.get('ANSWER_CACHE_TTL', 3600))
+ANSWER_CACHE_MAX_BYTES = int(os.environ.get('ANSWER_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+# Later turns depend on the conversation so far, by default only first questions are shared
+ANSWER_CACHE_FIRST_TURN_ONLY = os.environ.get('ANSWER_CACHE_FIRST_TURN_ONLY', 'true').lower() == 'true'
+
+# Per-conversation identifiers that must not leak into another student's answer
+SESSION_FIELDS = ('sessionId', 'chatId', 'chatMessageId', 'question')
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_question(question: str) -> str:
+    return _WHITESPACE.sub(' ', question).strip().lower().rstrip('?!. ')
+
+
+class AnswerCache:
+    """Byte-bounded TTL + LRU cache of Flowise answers keyed by chatflow and question."""
+
+    def __init__(
+        self,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_bytes: int = ANSWER_CACHE_MAX_BYTES,
+        first_turn_only: bool = ANSWER_CACHE_FIRST_TURN_ONLY
+    ):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.first_turn_only = first_turn_only
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, chatflow: str, question: str, turn: int) -> Optional[tuple]:
+        if self.first_turn_only and turn != 0:
+            return None
+        return (chatflow, normalize_question(question))
+
+    def get(self, chatflow: str, question: str, turn: int = 0) -> Optional[Dict]:
+        key = self._key(chatflow, question, turn)
+        if key is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        metrics.registry.inc('answer_cache_requests_total', outcome='miss' if entry is None else 'hit')
+        if entry is None:
+            return None
+        return dict(entry[1], question=question, cacheHit=True)
+
+    def put(self, chatflow: str, question: str, turn: int, response_json: Dict) -> None:
+        key = self._key(chatflow, question, turn)
+        if key is None or not response_json.get('text'):
+            return
+
+        answer = {k: v for k, v in response_json.items() if k not in SESSION_FIELDS}
+        size = len(json.dumps(answer))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, answer, size)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            metrics.registry.set_gauge('answer_cache_bytes', self.size_bytes)
+
+    def _remove(self, key: tuple) -> None:
+        _, _, size = self._entries.pop(key)
+        self.size_bytes -= size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_answer_cache = AnswerCache()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """The process-wide answer cache, or ``None`` unless ANSWER_CACHE_ENABLED is set."""
+    return _answer_cache if ANSWER_CACHE_ENABLED else None
@@ -0,0 +1,110 @@
+"""Cold-start and per-rerun timings for the Streamlit app.
+
+Imports each entry module in a fresh interpreter (what a new replica or a
+page importing it pays once), then reruns ``Home.py`` through Streamlit's
+AppTest harness (what every widget interaction pays).
+
+    python -m benchmarks.bench_startup --imports 5 --reruns 30
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Modules that are only needed off the Flowise path, reported when an import pulls them in
+HEAVY_MODULES = ['openai', 'pyairtable', 'httpx', 'pydantic', 'requests']
+
+IMPORT_PROBE = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module: str, runs: int, env: Dict[str, str]) -> Dict:
+    samples: List[float] = []
+    loaded: List[str] = []
+    for _ in range(runs):
+        probe = IMPORT_PROBE.format(root=ROOT, module=module, heavy=HEAVY_MODULES)
+        output = subprocess.run(
+            [sys.executable, '-c', probe], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result['seconds'])
+        loaded = result['loaded']
+    return {
+        'module': module,
+        'median_ms': statistics.median(samples) * 1000,
+        'min_ms': min(samples) * 1000,
+        'heavy_modules_loaded': loaded,
+    }
+
+
+def time_reruns(reruns: int, logged_in: bool) -> Dict:
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, 'Home.py'), default_timeout=30)
+    if logged_in:
+        app.session_state['logged_in'] = True
+        app.session_state['username'] = 'benchmark@revou.co'
+    app.run()  # first run pays the imports
+
+    samples: List[float] = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        samples.append(time.perf_counter() - started)
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+    samples.sort()
+    return {
+        'scenario': 'rerun (logged in)' if logged_in else 'rerun (login page)',
+        'median_ms': statistics.median(samples) * 1000,
+        'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--imports', type=int, default=5, help='fresh-interpreter imports per module')
+    parser.add_argument('--reruns', type=int, default=30, help='AppTest reruns per scenario')
+    parser.add_argument('--modules', nargs='+', default=['core', 'Home'], help='modules to import')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, AIRTABLE_API_KEY='benchmark', BASE_ID='appBenchmark', STREAMLIT_LOGGER_LEVEL='error')
+    os.environ.update(env)
+
+    report = {
+        'imports': [time_import(module, args.imports, env) for module in args.modules],
+        'reruns': [time_reruns(args.reruns, logged_in) for logged_in in (False, True)],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    print(f"{'import':<24}{'median ms':>12}{'min ms':>10}  heavy modules loaded")
+    for r in report['imports']:
+        print(f"{r['module']:<24}{r['median_ms']:>12.1f}{r['min_ms']:>10.1f}  {', '.join(r['heavy_modules_loaded']) or '-'}")
+    print()
+    print(f"{'rerun':<24}{'median ms':>12}{'p95 ms':>10}")
+    for r in report['reruns']:
+        print(f"{r['scenario']:<24}{r['median_ms']:>12.1f}{r['p95_ms']:>10.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""Offline load test for DALA against local Flowise and Airtable stand-ins.
+
+Simulates N students hitting login, the Flowise prediction path and chat
+history saving concurrently, then reports latency percentiles, throughput and
+the number of calls each backend received.
+
+    python -m benchmarks.run_benchmark --students 50 --messages 5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.stubs import AirtableStub, FlowiseStub  # noqa: E402
+
+BASE_ID = 'appBenchmark'
+CHATFLOW_ID = 'benchmark-chatflow'
+QUESTIONS = [
+    'How do I join two tables in BigQuery?',
+    'What is the difference between WHERE and HAVING?',
+    'How should I clean missing values in my DEEPP dataset?',
+]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class ScenarioResult:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.first_token: List[float] = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self.api_calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, first_token: Optional[float] = None, error: bool = False) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            if first_token is not None:
+                self.first_token.append(first_token)
+            if error:
+                self.errors += 1
+
+    def summary(self) -> Dict:
+        latencies = sorted(self.latencies)
+        first_token = sorted(self.first_token)
+        summary = {
+            'scenario': self.name,
+            'requests': len(latencies),
+            'errors': self.errors,
+            'throughput_rps': len(latencies) / self.elapsed if self.elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'api_calls': self.api_calls,
+        }
+        if first_token:
+            summary['ttft_p50_ms'] = percentile(first_token, 50) * 1000
+            summary['ttft_p95_ms'] = percentile(first_token, 95) * 1000
+        return summary
+
+
+def run_scenario(
+    name: str,
+    students: int,
+    messages: int,
+    action: Callable[[int, int], Optional[float]],
+    stubs: List[AirtableStub],
+    after: Optional[Callable[[], None]] = None
+) -> ScenarioResult:
+    """Run ``action(student, message)`` for every student concurrently.
+
+    ``action`` returns the time-to-first-token for streaming calls, ``None``
+    otherwise, and raises on failure.
+    """
+    result = ScenarioResult(name)
+    before = [Counter(stub.calls) for stub in stubs]
+    start_barrier = threading.Barrier(students)
+
+    def student(index: int) -> None:
+        start_barrier.wait()
+        for message in range(messages):
+            started = time.perf_counter()
+            try:
+                first_token = action(index, message)
+                result.record(time.perf_counter() - started, first_token)
+            except Exception:
+                result.record(time.perf_counter() - started, error=True)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=students) as pool:
+        list(pool.map(student, range(students)))
+    if after is not None:
+        # e.g. drain background writers so their API calls are attributed here
+        after()
+    result.elapsed = time.perf_counter() - started
+
+    for stub, counts in zip(stubs, before):
+        for call, count in (Counter(stub.calls) - counts).items():
+            result.api_calls[f'{type(stub).__name__.replace("Stub", "").lower()}.{call}'] = count
+    return result
+
+
+def print_report(summaries: List[Dict]) -> None:
+    header = f"{'scenario':<32}{'reqs':>7}{'errs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttft p50':>10}"
+    print(header)
+    print('-' * len(header))
+    for s in summaries:
+        ttft = f"{s['ttft_p50_ms']:.1f}" if 'ttft_p50_ms' in s else '-'
+        print(f"{s['scenario']:<32}{s['requests']:>7}{s['errors']:>6}{s['throughput_rps']:>9.1f}"
+              f"{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{ttft:>10}")
+        calls = ', '.join(f'{k}={v}' for k, v in sorted(s['api_calls'].items()))
+        print(f"{'':<4}api calls: {calls or 'none'}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=20, help='concurrent simulated students')
+    parser.add_argument('--messages', type=int, default=3, help='messages sent by each student')
+    parser.add_argument('--flowise-latency', type=float, default=0.3, help='seconds before Flowise answers')
+    parser.add_argument('--token-rate', type=float, default=200.0, help='streamed tokens per second (0 = instant)')
+    parser.add_argument('--tokens', type=int, default=50, help='tokens per answer')
+    parser.add_argument('--airtable-latency', type=float, default=0.05, help='seconds per Airtable request')
+    parser.add_argument('--airtable-rps', type=float, default=5.0, help='Airtable rate limit before 429s (0 = unlimited)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    flowise = FlowiseStub(latency=args.flowise_latency, token_rate=args.token_rate, tokens_per_answer=args.tokens).start()
+    airtable = AirtableStub(latency=args.airtable_latency, rate_limit=args.airtable_rps).start()
+    airtable.seed(BASE_ID, 'Users', [
+        {'Username': f'student{i}@revou.co', 'Password': f'0811{i:04d}', 'StudentID': f'S{i:04d}'}
+        for i in range(args.students)
+    ])
+
+    data_dir = tempfile.mkdtemp(prefix='dala-bench-')
+    os.environ.update({
+        'BASE_ID': BASE_ID,
+        'AIRTABLE_API_KEY': 'benchmark',
+        'AIRTABLE_ENDPOINT_URL': airtable.url,
+        'CHAT_WRITER_SPILL_PATH': os.path.join(data_dir, 'spill.jsonl'),
+        'CHAT_STORE_PATH': os.path.join(data_dir, 'chat_history.db'),
+        'STREAMLIT_LOGGER_LEVEL': 'error',
+    })
+
+    # Imported after the environment points at the stubs
+    import core
+    from chat_store import close_chat_store
+    from pages_section.flowise_test import Flowise, FlowiseClientOptions, PredictionData
+
+    prediction_url = f'{flowise.url}/api/v1/prediction/{CHATFLOW_ID}'
+    client = Flowise(FlowiseClientOptions(base_url=flowise.url))
+    stubs = [flowise, airtable]
+
+    def login(student: int, message: int):
+        username = f'student{student}@revou.co'
+        user = core.get_login_user(username)
+        if not user or not core.verify_password(user['fields'].get('Password'), f'0811{student:04d}'):
+            raise RuntimeError('login failed')
+
+    def login_shared_account(student: int, message: int):
+        # Everyone signs in to one account at once, e.g. a demo account during a class
+        user = core.get_login_user('student0@revou.co')
+        if not user or not core.verify_password(user['fields'].get('Password'), '08110000'):
+            raise RuntimeError('login failed')
+
+    def custom_api(student: int, message: int):
+        if not core.generate_custom_api_response(prediction_url, {}, QUESTIONS[message % len(QUESTIONS)]):
+            raise RuntimeError('no response')
+
+    def custom_api_stream(student: int, message: int):
+        started = time.perf_counter()
+        first_token = []
+
+        def on_token(text):
+            if not first_token:
+                first_token.append(time.perf_counter() - started)
+
+        if not core.stream_custom_api_response(prediction_url, {}, QUESTIONS[message % len(QUESTIONS)], on_token):
+            raise RuntimeError('no response')
+        return first_token[0] if first_token else None
+
+    def save_history(student: int, message: int):
+        core.save_chat_history(
+            session_id=f'session-{student}',
+            username=f'student{student}@revou.co',
+            user_input=QUESTIONS[message % len(QUESTIONS)],
+            response_json={'text': 'benchmark answer', 'sessionId': f'session-{student}'}
+        )
+
+    def drain_history():
+        close_chat_store()
+
+    def sdk_prediction(streaming: bool):
+        def action(student: int, message: int):
+            started = time.perf_counter()
+            first_token = None
+            for _ in client.create_prediction(PredictionData(CHATFLOW_ID, QUESTIONS[message % len(QUESTIONS)], streaming=streaming)):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+            return first_token if streaming else None
+        return action
+
+    scenarios = [
+        ('login (get_login_user)', login, None),
+        ('login, one shared account', login_shared_account, None),
+        ('generate_custom_api_response', custom_api, None),
+        ('stream_custom_api_response', custom_api_stream, None),
+        ('save_chat_history (+drain)', save_history, drain_history),
+        ('Flowise.create_prediction', sdk_prediction(False), None),
+        ('Flowise.create_prediction stream', sdk_prediction(True), None),
+    ]
+
+    summaries = []
+    try:
+        for name, action, after in scenarios:
+            summaries.append(run_scenario(name, args.students, args.messages, action, stubs, after).summary())
+    finally:
+        flowise.stop()
+        airtable.stop()
+
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+    else:
+        print_report(summaries)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""Local stand-ins for the Flowise prediction API and the Airtable REST API.
+
+Both servers run in a background thread, answer on 127.0.0.1 and count every
+request they receive so benchmarks can report API call volumes.
+"""
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler_class, port: int = 0):
+        super().__init__(('127.0.0.1', port), handler_class)
+        self.calls = Counter()
+        self._calls_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, name: str) -> None:
+        with self._calls_lock:
+            self.calls[name] += 1
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self) -> Dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def send_json(self, status: int, body, headers: Optional[Dict] = None) -> None:
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FlowiseStubHandler(_JSONHandler):
+    server: 'FlowiseStub'
+
+    def do_GET(self):
+        if self.path.startswith('/api/v1/chatflows-streaming/'):
+            self.server.count('chatflows-streaming')
+            self.send_json(200, {'isStreaming': self.server.is_streaming})
+        else:
+            self.send_json(404, {'message': 'Not found'})
+
+    def do_POST(self):
+        # /api/v1/prediction/<chatflowId> for the SDK, anything else for FLOWISE_ENDPOINT style URLs
+        body = self.read_json()
+        session_id = (body.get('overrideConfig') or {}).get('sessionId') or str(uuid.uuid4())
+        answer_tokens = [f'token{i} ' for i in range(self.server.tokens_per_answer)]
+
+        time.sleep(self.server.latency)
+
+        if body.get('streaming') and self.server.is_streaming:
+            self.server.count('prediction-stream')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            # Flowise (Express) streams SSE with chunked transfer encoding
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.write_event('start', '')
+            for token in answer_tokens:
+                if self.server.token_interval:
+                    time.sleep(self.server.token_interval)
+                self.write_event('token', token)
+            self.write_event('sourceDocuments', [{'pageContent': 'stub document', 'metadata': {}}])
+            self.write_event('metadata', {'sessionId': session_id, 'chatId': session_id, 'question': body.get('question')})
+            self.write_event('end', '[DONE]')
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.server.count('prediction')
+            if self.server.token_interval:
+                time.sleep(self.server.token_interval * len(answer_tokens))
+            self.send_json(200, {
+                'text': ''.join(answer_tokens),
+                'question': body.get('question'),
+                'sessionId': session_id,
+                'chatId': session_id,
+                'sourceDocuments': [{'pageContent': 'stub document', 'metadata': {}}]
+            })
+
+    def write_event(self, event: str, data) -> None:
+        chunk = b'message:\ndata:' + json.dumps({'event': event, 'data': data}).encode('utf-8') + b'\n\n'
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.flush()
+
+
+class FlowiseStub(StubServer):
+    """Emulates Flowise ``/prediction`` with a fixed latency and token rate."""
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0.5,
+        token_rate: float = 50.0,
+        tokens_per_answer: int = 100,
+        is_streaming: bool = True
+    ):
+        super().__init__(FlowiseStubHandler, port)
+        self.latency = latency
+        self.token_interval = 1.0 / token_rate if token_rate else 0.0
+        self.tokens_per_answer = tokens_per_answer
+        self.is_streaming = is_streaming
+
+
+_EQUALS_FORMULA = re.compile(r"^\{(?P<field>[^}]+)\}\s*=\s*'(?P<value>(?:[^'\\]|\\.)*)'$")
+
+
+class AirtableStubHandler(_JSONHandler):
+    server: 'AirtableStub'
+
+    def table_key(self) -> Optional[str]:
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if len(parts) < 3 or parts[0] != 'v0':
+            return None
+        return f'{parts[1]}/{unquote(parts[2])}'
+
+    def throttled(self) -> bool:
+        if self.server.allow_request():
+            return False
+        self.server.count('429')
+        self.send_json(429, {'errors': [{'error': 'RATE_LIMIT_REACHED'}]}, headers={'Retry-After': '1'})
+        return True
+
+    def do_GET(self):
+        table = self.table_key()
+        if table is None:
+            self.send_json(404, {'error': 'NOT_FOUND'})
+            return
+        self.server.count('list')
+        if self.throttled():
+            return
+
+        query = parse_qs(urlparse(self.path).query)
+        records = self.server.records_for(table)
+        formula = (query.get('filterByFormula') or [''])[0]
+        if formula:
+            matched = _EQUALS_FORMULA.match(formula)
+            if matched:
+                field, value = matched.group('field'), matched.group('value').replace("\\'", "'")
+                records = [r for r in records if str(r['fields'].get(field)) == value]
+        max_records = int((query.get('maxRecords') or [0])[0])
+        if max_records:
+            records = records[:max_records]
+        fields = query.get('fields[]')
+        if fields:
+            records = [dict(r, fields={k: v for k, v in r['fields'].items() if k in fields}) for r in records]
+
+        time.sleep(self.server.latency)
+        self.send_json(200, {'records': records})
+
+    def do_POST(self):
+        table = self.table_key()
+        if table is None:
+            self.send_json(404, {'error': 'NOT_FOUND'})
+            return
+        body = self.read_json()
+        batch = 'records' in body
+        self.server.count('batch_create' if batch else 'create')
+        if self.throttled():
+            return
+
+        created = [self.server.insert(table, r['fields']) for r in body['records']] if batch else [self.server.insert(table, body['fields'])]
+        time.sleep(self.server.latency)
+        self.send_json(200, {'records': created} if batch else created[0])
+
+
+class AirtableStub(StubServer):
+    """Emulates the Airtable records API, including the per-base 429 rate limit."""
+
+    def __init__(self, port: int = 0, latency: float = 0.1, rate_limit: float = 5.0):
+        super().__init__(AirtableStubHandler, port)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self._tables: Dict[str, List[Dict]] = {}
+        self._tables_lock = threading.Lock()
+        self._tokens = rate_limit
+        self._refilled_at = time.monotonic()
+
+    def allow_request(self) -> bool:
+        if not self.rate_limit:
+            return True
+        with self._tables_lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled_at) * self.rate_limit)
+            self._refilled_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def records_for(self, table: str) -> List[Dict]:
+        with self._tables_lock:
+            return list(self._tables.get(table, []))
+
+    def insert(self, table: str, fields: Dict) -> Dict:
+        record = {'id': 'rec' + uuid.uuid4().hex[:14], 'createdTime': time.strftime('%Y-%m-%dT%H:%M:%S.000Z'), 'fields': fields}
+        with self._tables_lock:
+            self._tables.setdefault(table, []).append(record)
+        return record
+
+    def seed(self, base_id: str, table_name: str, rows: List[Dict]) -> None:
+        for fields in rows:
+            self.insert(f'{base_id}/{table_name}', fields)
@@ -0,0 +1,439 @@
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+import metrics
+from http_session import get_http_session
+from sse import EndEvent, ErrorEvent, MetadataEvent, TokenEvent, iter_flowise_events
+from tool_executor import get_tool_executor
+
+# flowise or openai; an empty secondary disables the router
+CHAT_PRIMARY_BACKEND = os.environ.get('CHAT_PRIMARY_BACKEND', 'flowise')
+CHAT_SECONDARY_BACKEND = os.environ.get('CHAT_SECONDARY_BACKEND', '')
+FLOWISE_SECONDARY_ENDPOINT = os.environ.get('FLOWISE_SECONDARY_ENDPOINT')
+FLOWISE_SECONDARY_KEY = os.environ.get('FLOWISE_SECONDARY_KEY')
+OPENAI_ASSISTANT_ID = os.environ.get('OPENAI_ASSISTANT_ID')
+
+ROUTER_LATENCY_WINDOW = int(os.environ.get('ROUTER_LATENCY_WINDOW', 200))
+# Below this many samples the p95 is not trusted and ROUTER_HEDGE_DELAY is used
+ROUTER_MIN_SAMPLES = int(os.environ.get('ROUTER_MIN_SAMPLES', 20))
+ROUTER_HEDGE_DELAY = float(os.environ.get('ROUTER_HEDGE_DELAY', 10.0))
+ROUTER_FAILURE_THRESHOLD = int(os.environ.get('ROUTER_FAILURE_THRESHOLD', 3))
+ROUTER_COOLDOWN = float(os.environ.get('ROUTER_COOLDOWN', 30.0))
+ROUTER_MAX_WORKERS = int(os.environ.get('ROUTER_MAX_WORKERS', 32))
+# How often streamed tokens are handed from the backend threads to the caller
+ROUTER_TOKEN_POLL = float(os.environ.get('ROUTER_TOKEN_POLL', 0.05))
+
+
+class BackendError(Exception):
+    pass
+
+
+class BackendCancelled(BackendError):
+    pass
+
+
+class ChatBackend(ABC):
+    """One way of answering a student's question.
+
+    ``ask`` returns a Flowise-shaped response JSON (at least ``text``) and may be
+    called from a worker thread, so it must not touch Streamlit.
+    ``conversation_id`` is the backend's own conversation handle (Flowise
+    sessionId, OpenAI thread id); the one to reuse next time is returned under
+    ``conversationId``.
+    """
+
+    name = 'backend'
+
+    @abstractmethod
+    def ask(
+        self,
+        question: str,
+        conversation_id: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None,
+        cancel: Optional[threading.Event] = None,
+        uploads: Optional[List] = None
+    ) -> Dict:
+        ...
+
+
+class FlowiseBackend(ChatBackend):
+    name = 'flowise'
+
+    def __init__(self, api_url: str, headers: Optional[Dict] = None, streaming: bool = True, name: Optional[str] = None):
+        self.api_url = api_url
+        self.headers = headers or {}
+        self.streaming = streaming
+        if name:
+            self.name = name
+
+    def ask(self, question, conversation_id=None, on_token=None, cancel=None, uploads=None):
+        payload = {
+            "question": question,
+            "streaming": self.streaming,
+            "overrideConfig": {"sessionId": conversation_id},
+        }
+        if uploads:
+            payload["uploads"] = [upload.__dict__ for upload in uploads]
+
+        try:
+            with get_http_session().post(self.api_url, json=payload, headers=self.headers, stream=self.streaming) as response:
+                if response.status_code != 200:
+                    raise BackendError(f"Error {response.status_code}: {response.text}")
+
+                if not response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                    response_json = response.json()
+                else:
+                    response_json = {"text": ""}
+                    for event in iter_flowise_events(response.iter_content(chunk_size=None)):
+                        if cancel is not None and cancel.is_set():
+                            raise BackendCancelled(self.name)
+                        if isinstance(event, TokenEvent):
+                            if event.data:
+                                response_json['text'] += event.data
+                                if on_token is not None:
+                                    on_token(response_json['text'])
+                        elif isinstance(event, MetadataEvent):
+                            response_json.update(event.data or {})
+                        elif isinstance(event, ErrorEvent):
+                            raise BackendError(f"Error from API: {event.data}")
+                        elif isinstance(event, EndEvent):
+                            break
+                        elif event.event != 'start':
+                            response_json[event.event] = event.data
+        except requests.RequestException as e:
+            raise BackendError(f"Error contacting API: {str(e)}") from e
+
+        response_json['conversationId'] = response_json.get('sessionId', conversation_id)
+        return response_json
+
+
+class OpenAIAssistantBackend(ChatBackend):
+    """OpenAI (or Azure OpenAI) Assistants run on a thread, as in the original Assistants page."""
+
+    name = 'openai'
+
+    def __init__(self, assistant_id: str, client=None, poll_interval: float = 0.5, instructions: Optional[str] = None):
+        self.assistant_id = assistant_id
+        self.poll_interval = poll_interval
+        self.instructions = instructions if instructions is not None else os.environ.get('RUN_INSTRUCTIONS') or None
+        self._client = client
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    # openai is only imported when this backend is actually used
+                    import openai
+
+                    if os.environ.get('AZURE_OPENAI_ENDPOINT') and os.environ.get('AZURE_OPENAI_KEY'):
+                        self._client = openai.AzureOpenAI(
+                            api_key=os.environ['AZURE_OPENAI_KEY'],
+                            api_version="2024-05-01-preview",
+                            azure_endpoint=os.environ['AZURE_OPENAI_ENDPOINT'],
+                        )
+                    else:
+                        self._client = openai.OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+        return self._client
+
+    def run_tools(self, tool_calls) -> List[Dict]:
+        # All calls of the turn run concurrently and are submitted together
+        return get_tool_executor().execute(tool_calls)
+
+    def ask(self, question, conversation_id=None, on_token=None, cancel=None, uploads=None):
+        try:
+            threads = self.client.beta.threads
+            if conversation_id is None:
+                conversation_id = threads.create().id
+            threads.messages.create(thread_id=conversation_id, role="user", content=question)
+
+            run_options = {"instructions": self.instructions} if self.instructions else {}
+            run = threads.runs.create(thread_id=conversation_id, assistant_id=self.assistant_id, **run_options)
+            while run.status in ('queued', 'in_progress', 'cancelling', 'requires_action'):
+                if cancel is not None and cancel.is_set():
+                    threads.runs.cancel(thread_id=conversation_id, run_id=run.id)
+                    raise BackendCancelled(self.name)
+                if run.status == 'requires_action':
+                    run = threads.runs.submit_tool_outputs(
+                        thread_id=conversation_id,
+                        run_id=run.id,
+                        tool_outputs=self.run_tools(run.required_action.submit_tool_outputs.tool_calls)
+                    )
+                    continue
+                time.sleep(self.poll_interval)
+                run = threads.runs.retrieve(thread_id=conversation_id, run_id=run.id)
+
+            if run.status != 'completed':
+                raise BackendError(f"Assistant run {run.status}: {getattr(run, 'last_error', None)}")
+
+            message = threads.messages.list(thread_id=conversation_id, run_id=run.id, limit=1).data[0]
+            text = ''.join(part.text.value for part in message.content if part.type == 'text')
+        except BackendError:
+            raise
+        except Exception as e:
+            raise BackendError(f"Error from assistant: {str(e)}") from e
+
+        if on_token is not None:
+            on_token(text)
+
+        response_json = {"text": text, "conversationId": conversation_id, "threadId": conversation_id}
+        if run.usage is not None:
+            response_json["usage"] = {
+                "prompt_tokens": run.usage.prompt_tokens,
+                "completion_tokens": run.usage.completion_tokens,
+                "total_tokens": run.usage.total_tokens,
+            }
+        return response_json
+
+
+class BackendStats:
+    """Rolling latency window and health of one backend."""
+
+    def __init__(self, window: int = ROUTER_LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.lock = threading.Lock()
+
+    def record_success(self, seconds: float) -> None:
+        with self.lock:
+            self.latencies.append(seconds)
+            self.consecutive_failures = 0
+            self.unhealthy_until = 0.0
+
+    def record_latency(self, seconds: float) -> None:
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def record_failure(self, threshold: int, cooldown: float) -> None:
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= threshold:
+                self.unhealthy_until = time.monotonic() + cooldown
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def p95(self) -> Optional[float]:
+        with self.lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class HedgedRouter:
+    """Sends each question to the primary backend and hedges to the next one when it is slow.
+
+    If the primary has not answered within its rolling p95, the same question
+    goes to the secondary too and the first successful answer wins; the loser
+    is cancelled. A backend that fails ``failure_threshold`` times in a row is
+    skipped for ``cooldown`` seconds, so the secondary becomes primary.
+    """
+
+    def __init__(
+        self,
+        backends: List[ChatBackend],
+        min_samples: int = ROUTER_MIN_SAMPLES,
+        default_hedge_delay: float = ROUTER_HEDGE_DELAY,
+        failure_threshold: int = ROUTER_FAILURE_THRESHOLD,
+        cooldown: float = ROUTER_COOLDOWN,
+        executor: Optional[ThreadPoolExecutor] = None
+    ):
+        self.backends = backends
+        self.min_samples = min_samples
+        self.default_hedge_delay = default_hedge_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.stats = {backend.name: BackendStats() for backend in backends}
+        self.executor = executor or _get_executor()
+
+    def hedge_delay(self, backend: ChatBackend) -> float:
+        stats = self.stats[backend.name]
+        if len(stats.latencies) < self.min_samples:
+            return self.default_hedge_delay
+        return stats.p95()
+
+    def ordered_backends(self) -> List[ChatBackend]:
+        healthy = [b for b in self.backends if self.stats[b.name].healthy()]
+        unhealthy = [b for b in self.backends if not self.stats[b.name].healthy()]
+        # Unhealthy backends stay as a last resort
+        return healthy + unhealthy
+
+    def _call(self, backend: ChatBackend, question: str, conversations: Dict, cancel: threading.Event, uploads, on_token=None) -> Dict:
+        started = time.perf_counter()
+        try:
+            response_json = backend.ask(question, conversations.get(backend.name), on_token=on_token, cancel=cancel, uploads=uploads)
+        except BackendCancelled:
+            # It would have taken at least this long; leaving losers out would pull the p95,
+            # and with it the hedge delay, down after every hedge
+            self.stats[backend.name].record_latency(time.perf_counter() - started)
+            metrics.registry.inc('chat_backend_requests_total', backend=backend.name, outcome='cancelled')
+            raise
+        except Exception:
+            self.stats[backend.name].record_failure(self.failure_threshold, self.cooldown)
+            metrics.registry.inc('chat_backend_requests_total', backend=backend.name, outcome='error')
+            raise
+        elapsed = time.perf_counter() - started
+        self.stats[backend.name].record_success(elapsed)
+        metrics.registry.observe('chat_backend_duration_seconds', elapsed, backend=backend.name)
+        metrics.registry.inc('chat_backend_requests_total', backend=backend.name, outcome='ok')
+        response_json['backend'] = backend.name
+        return response_json
+
+    def ask(
+        self,
+        question: str,
+        conversations: Dict[str, str],
+        uploads: Optional[List] = None,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict:
+        """Answer ``question``; ``conversations`` maps backend name to its conversation id and is updated.
+
+        ``on_token`` gets the reply so far, on the calling thread (backends run
+        on workers, which cannot draw Streamlit elements). The first backend to
+        stream a token owns the reply: the others are cancelled and no further
+        hedge is sent, unless it fails and the router fails over.
+        """
+        pending_backends = self.ordered_backends()
+        cancel_events = {}
+        futures = {}
+        last_error: Optional[BaseException] = None
+        tokens: "queue.Queue[str]" = queue.Queue()
+        stream_lock = threading.Lock()
+        stream_owner: List[Optional[str]] = [None]
+
+        def relay(backend: ChatBackend) -> Optional[Callable[[str], None]]:
+            if on_token is None:
+                return None
+
+            def on_backend_token(text: str) -> None:
+                with stream_lock:
+                    if stream_owner[0] is None:
+                        stream_owner[0] = backend.name
+                        for name, event in cancel_events.items():
+                            if name != backend.name:
+                                event.set()
+                    if stream_owner[0] != backend.name:
+                        return
+                tokens.put(text)
+            return on_backend_token
+
+        def flush_tokens() -> None:
+            latest = None
+            while True:
+                try:
+                    latest = tokens.get_nowait()
+                except queue.Empty:
+                    break
+            # Each token carries the whole reply so far, only the newest needs drawing
+            if latest is not None:
+                on_token(latest)
+
+        def launch():
+            backend = pending_backends.pop(0)
+            cancel_events[backend.name] = threading.Event()
+            future = self.executor.submit(
+                self._call, backend, question, conversations, cancel_events[backend.name], uploads, relay(backend)
+            )
+            futures[future] = backend
+            return backend
+
+        primary = launch()
+        hedge_at = time.monotonic() + self.hedge_delay(primary)
+
+        while futures:
+            timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+            if on_token is not None:
+                timeout = ROUTER_TOKEN_POLL if timeout is None else min(timeout, ROUTER_TOKEN_POLL)
+            done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+            if on_token is not None:
+                flush_tokens()
+            if not done:
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    # The in-flight backend is slower than its p95 and has not started streaming, hedge to the next one
+                    if pending_backends and stream_owner[0] is None:
+                        backend = launch()
+                        metrics.registry.inc('chat_router_hedges_total', backend=backend.name)
+                    hedge_at = None
+                continue
+
+            for future in done:
+                backend = futures.pop(future)
+                try:
+                    response_json = future.result()
+                except Exception as e:
+                    last_error = e
+                    with stream_lock:
+                        if stream_owner[0] == backend.name:
+                            stream_owner[0] = None
+                    continue
+
+                for name, event in cancel_events.items():
+                    if name != backend.name:
+                        event.set()
+                if response_json.get('conversationId'):
+                    conversations[backend.name] = response_json['conversationId']
+                return response_json
+
+            # Everything in flight failed, fail over to the next backend straight away
+            if not futures and pending_backends:
+                backend = launch()
+                metrics.registry.inc('chat_router_failovers_total', backend=backend.name)
+                hedge_at = time.monotonic() + self.hedge_delay(backend)
+
+        raise last_error or BackendError("No chat backend available")
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_routers: Dict[str, HedgedRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ROUTER_MAX_WORKERS, thread_name_prefix='chat-backend')
+    return _executor
+
+
+def build_backend(kind: str, api_url: Optional[str] = None, headers: Optional[Dict] = None) -> ChatBackend:
+    if kind == 'flowise':
+        return FlowiseBackend(api_url, headers)
+    if kind == 'flowise-secondary':
+        headers = {"Authorization": FLOWISE_SECONDARY_KEY} if FLOWISE_SECONDARY_KEY else {}
+        return FlowiseBackend(FLOWISE_SECONDARY_ENDPOINT, headers, name='flowise-secondary')
+    if kind == 'openai':
+        if not OPENAI_ASSISTANT_ID:
+            raise ValueError("OPENAI_ASSISTANT_ID is required for the openai chat backend")
+        return OpenAIAssistantBackend(OPENAI_ASSISTANT_ID)
+    raise ValueError(f"Unknown chat backend: {kind}")
+
+
+def get_chat_router(api_url: str, headers: Optional[Dict] = None) -> Optional[HedgedRouter]:
+    """Process-wide router for the chat screen at ``api_url``, None when no secondary backend is configured."""
+    if not CHAT_SECONDARY_BACKEND:
+        return None
+    router = _routers.get(api_url)
+    if router is None:
+        with _routers_lock:
+            router = _routers.get(api_url)
+            if router is None:
+                router = HedgedRouter([
+                    build_backend(CHAT_PRIMARY_BACKEND, api_url, headers),
+                    build_backend(CHAT_SECONDARY_BACKEND, api_url, headers),
+                ])
+                _routers[api_url] = router
+    return router
@@ -0,0 +1,362 @@
+import atexit
+import glob
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from airtable_limiter import PRIORITY_WRITE, airtable_priority
+from chat_writer import AIRTABLE_MAX_BATCH_SIZE
+from idempotency import record_suppressed
+
+logger = logging.getLogger(__name__)
+
+# Set to an empty string to skip the local store and write to Airtable through chat_writer.
+# A {slot} placeholder lets replicas share one directory: each process locks the first free
+# slot, so a recreated replica takes over (and syncs) the store its predecessor left behind
+CHAT_STORE_PATH = os.environ.get('CHAT_STORE_PATH', 'chat_history.db')
+CHAT_SYNC_INTERVAL = float(os.environ.get('CHAT_SYNC_INTERVAL', 2.0))
+CHAT_SYNC_MAX_BACKOFF = float(os.environ.get('CHAT_SYNC_MAX_BACKOFF', 60.0))
+
+# Airtable field name -> SQLite column
+COLUMNS = {
+    'Timestamp': 'timestamp',
+    'SessionID': 'session_id',
+    'Username': 'username',
+    'UserInput': 'user_input',
+    'ResponseJSON': 'response_json',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp INTEGER NOT NULL,
+    session_id TEXT,
+    username TEXT,
+    user_input TEXT,
+    response_json TEXT,
+    idempotency_key TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chat_history_session_id ON chat_history (session_id);
+CREATE INDEX IF NOT EXISTS idx_chat_history_username ON chat_history (username);
+CREATE INDEX IF NOT EXISTS idx_chat_history_timestamp ON chat_history (timestamp);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    high_water_mark INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_dead_letter (
+    chat_history_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    error TEXT,
+    failed_at INTEGER NOT NULL,
+    PRIMARY KEY (chat_history_id, name)
+);
+"""
+
+# Created after _migrate, stores from before idempotency keys only get the column there
+INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_chat_history_idempotency_key ON chat_history (idempotency_key);
+"""
+
+
+class ChatStore:
+    """Local SQLite (WAL) store for chat history, the primary sink for save_chat_history."""
+
+    def __init__(self, path: str = CHAT_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        conn.executescript(INDEXES)
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, WAL lets readers and the sync worker run alongside writers
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(chat_history)')}
+        if 'idempotency_key' not in existing:
+            conn.execute('ALTER TABLE chat_history ADD COLUMN idempotency_key TEXT')
+
+    def append(self, fields: Dict, idempotency_key: Optional[str] = None) -> Optional[int]:
+        """Insert a record, or return ``None`` if one with the same ``idempotency_key`` exists."""
+        columns = [COLUMNS[name] for name in fields if name in COLUMNS]
+        values = [fields[name] for name in fields if name in COLUMNS]
+        # Not an Airtable field, so kept out of COLUMNS and never synced
+        columns.append('idempotency_key')
+        values.append(idempotency_key)
+        cursor = self._connection().execute(
+            f"INSERT OR IGNORE INTO chat_history ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            values
+        )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def history(
+        self,
+        session_id: Optional[str] = None,
+        username: Optional[str] = None,
+        since: Optional[int] = None,
+        limit: int = 100
+    ) -> List[Dict]:
+        """Most recent chat records first, filtered by session, user and/or timestamp."""
+        clauses, params = [], []
+        if session_id is not None:
+            clauses.append('session_id = ?')
+            params.append(session_id)
+        if username is not None:
+            clauses.append('username = ?')
+            params.append(username)
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            params.append(since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._connection().execute(
+            f'SELECT * FROM chat_history {where} ORDER BY timestamp DESC, id DESC LIMIT ?',
+            params + [limit]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def rows_after(self, high_water_mark: int, limit: int) -> List[Tuple[int, Dict]]:
+        rows = self._connection().execute(
+            'SELECT * FROM chat_history WHERE id > ? ORDER BY id LIMIT ?',
+            (high_water_mark, limit)
+        ).fetchall()
+        return [
+            (row['id'], {name: row[column] for name, column in COLUMNS.items() if row[column] is not None})
+            for row in rows
+        ]
+
+    def get_high_water_mark(self, name: str) -> int:
+        row = self._connection().execute(
+            'SELECT high_water_mark FROM sync_state WHERE name = ?', (name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def set_high_water_mark(self, name: str, value: int) -> None:
+        self._connection().execute(
+            'INSERT INTO sync_state (name, high_water_mark) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET high_water_mark = excluded.high_water_mark',
+            (name, value)
+        )
+
+    def add_dead_letter(self, name: str, row_id: int, error: str) -> None:
+        self._connection().execute(
+            'INSERT OR REPLACE INTO sync_dead_letter (chat_history_id, name, error, failed_at) VALUES (?, ?, ?, ?)',
+            (row_id, name, error, int(time.time()))
+        )
+
+    def dead_letters(self, name: str) -> List[Dict]:
+        """Rows the ``name`` sync gave up on, joined with the reason."""
+        rows = self._connection().execute(
+            'SELECT chat_history.*, sync_dead_letter.error, sync_dead_letter.failed_at FROM sync_dead_letter '
+            'JOIN chat_history ON chat_history.id = sync_dead_letter.chat_history_id '
+            'WHERE sync_dead_letter.name = ? ORDER BY chat_history.id',
+            (name,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def pending(self, name: str) -> int:
+        row = self._connection().execute(
+            'SELECT COUNT(*) FROM chat_history WHERE id > ?', (self.get_high_water_mark(name),)
+        ).fetchone()
+        return row[0]
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """A 4xx other than timeouts and rate limits, sending the same records again cannot succeed."""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+
+class AirtableSync:
+    """Replicates new ChatStore rows to Airtable in batches, resuming from a persisted high-water mark.
+
+    A row is only marked synced after its batch_create succeeds, so a crash
+    can resend at most one batch but never loses rows. A batch Airtable
+    rejects outright (e.g. 422 for an unknown field or an oversized value) is
+    split until the offending rows are found; those go to the dead-letter
+    table and the sync moves on past them.
+    """
+
+    name = 'airtable'
+
+    def __init__(
+        self,
+        store: ChatStore,
+        table,
+        batch_size: int = AIRTABLE_MAX_BATCH_SIZE,
+        interval: float = CHAT_SYNC_INTERVAL,
+        max_backoff: float = CHAT_SYNC_MAX_BACKOFF
+    ):
+        self.store = store
+        self.table = table
+        self.batch_size = max(1, min(batch_size, AIRTABLE_MAX_BATCH_SIZE))
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._unsynced = 0
+        self._thread = threading.Thread(target=self._run, name='chat-history-sync', daemon=True)
+        self._thread.start()
+
+    def notify(self) -> None:
+        # Size trigger: wake the worker as soon as a full batch is waiting
+        self._unsynced += 1
+        if self._unsynced >= self.batch_size:
+            self._wake.set()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        failures = 0
+        while True:
+            # Time trigger
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            stopping = self._stop.is_set()
+            try:
+                self.sync_pending()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                delay = min(self.max_backoff, self.interval * (2 ** failures))
+                logger.warning(f"Error syncing chat history to Airtable, retrying in {delay:.1f}s: {str(e)}")
+                if stopping:
+                    return
+                self._stop.wait(delay + random.uniform(0, self.interval))
+            if stopping:
+                return
+
+    def sync_pending(self) -> int:
+        synced = 0
+        high_water_mark = self.store.get_high_water_mark(self.name)
+        while True:
+            rows = self.store.rows_after(high_water_mark, self.batch_size)
+            if not rows:
+                self._unsynced = 0
+                return synced
+            synced += self._send(rows)
+            high_water_mark = rows[-1][0]
+
+    def _send(self, rows: List[Tuple[int, Dict]]) -> int:
+        """Create ``rows`` in Airtable, advancing the high-water mark past each part that is done."""
+        try:
+            with airtable_priority(PRIORITY_WRITE):
+                self.table.batch_create([fields for _, fields in rows])
+        except Exception as e:
+            if not is_permanent_error(e):
+                raise
+            if len(rows) > 1:
+                middle = len(rows) // 2
+                return self._send(rows[:middle]) + self._send(rows[middle:])
+            row_id = rows[0][0]
+            logger.error(f"Airtable rejected chat history row {row_id}, moved to sync_dead_letter: {str(e)}")
+            metrics.registry.inc('chat_sync_dead_letters_total')
+            self.store.add_dead_letter(self.name, row_id, str(e))
+            self.store.set_high_water_mark(self.name, row_id)
+            return 0
+        self.store.set_high_water_mark(self.name, rows[-1][0])
+        return len(rows)
+
+
+_store: Optional[ChatStore] = None
+_sync: Optional[AirtableSync] = None
+_store_lock = threading.Lock()
+_slot_lock_file = None
+
+
+def _lock_slot(path: str):
+    """An exclusive lock on ``path``'s slot, or ``None`` if another process holds it."""
+    import fcntl
+    lock_file = open(path + '.lock', 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def resolve_store_path(path: str) -> str:
+    """Expand a ``{slot}`` placeholder to the first slot no other process holds, and hold it."""
+    global _slot_lock_file
+    if '{slot}' not in path:
+        return path
+    slot = 0
+    while True:
+        candidate = path.format(slot=slot)
+        lock_file = _lock_slot(candidate)
+        if lock_file is not None:
+            # Released when the process exits
+            _slot_lock_file = lock_file
+            return candidate
+        slot += 1
+
+
+def drain_orphaned_stores(path: str, table) -> None:
+    """Sync the rows left in slots nobody holds, e.g. after scaling replicas down."""
+    own = _store.path if _store is not None else None
+    for candidate in sorted(glob.glob(path.replace('{slot}', '*'))):
+        if candidate == own:
+            continue
+        lock_file = _lock_slot(candidate)
+        if lock_file is None:
+            continue
+        try:
+            store = ChatStore(candidate)
+            if store.pending(AirtableSync.name):
+                # close() makes one last pass over the unsynced rows
+                AirtableSync(store, table).close()
+        except Exception as e:
+            logger.warning(f"Error draining chat store {candidate}: {str(e)}")
+        finally:
+            lock_file.close()
+
+
+def get_chat_store(table) -> Optional[ChatStore]:
+    """Return the process-wide store (starting its Airtable sync with ``table``), or ``None`` if disabled."""
+    global _store, _sync
+    if not CHAT_STORE_PATH:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = ChatStore(resolve_store_path(CHAT_STORE_PATH))
+                _sync = AirtableSync(store, table)
+                atexit.register(_sync.close)
+                _store = store
+                if '{slot}' in CHAT_STORE_PATH:
+                    threading.Thread(
+                        target=drain_orphaned_stores, args=(CHAT_STORE_PATH, table), name='chat-history-drain', daemon=True
+                    ).start()
+    return _store
+
+
+def close_chat_store(timeout: Optional[float] = None) -> None:
+    """Stop the sync worker after one last pass over unsynced rows."""
+    if _sync is not None:
+        _sync.close(timeout)
+
+
+def save_chat_record(table, fields: Dict, idempotency_key: Optional[str] = None) -> None:
+    """Write ``fields`` to the local store and schedule it for Airtable sync."""
+    if get_chat_store(table).append(fields, idempotency_key) is None:
+        record_suppressed('history')
+        return
+    _sync.notify()
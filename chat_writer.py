@@ -0,0 +1,183 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from airtable_limiter import PRIORITY_WRITE, airtable_priority
+from idempotency import record_suppressed
+
+logger = logging.getLogger(__name__)
+
+# Airtable rejects batch_create requests with more than 10 records
+AIRTABLE_MAX_BATCH_SIZE = 10
+
+CHAT_WRITER_BATCH_SIZE = min(int(os.environ.get('CHAT_WRITER_BATCH_SIZE', AIRTABLE_MAX_BATCH_SIZE)), AIRTABLE_MAX_BATCH_SIZE)
+CHAT_WRITER_FLUSH_INTERVAL = float(os.environ.get('CHAT_WRITER_FLUSH_INTERVAL', 2.0))
+CHAT_WRITER_MAX_RETRIES = int(os.environ.get('CHAT_WRITER_MAX_RETRIES', 3))
+CHAT_WRITER_SPILL_PATH = os.environ.get('CHAT_WRITER_SPILL_PATH', 'chat_history_spill.jsonl')
+# Idempotency keys remembered to drop resubmitted records
+CHAT_WRITER_DEDUPE_SIZE = int(os.environ.get('CHAT_WRITER_DEDUPE_SIZE', 4096))
+
+_STOP = object()
+
+
+class ChatHistoryWriter:
+    """Background writer that batches chat records into Airtable ``batch_create`` calls."""
+
+    def __init__(
+        self,
+        table,
+        batch_size: int = CHAT_WRITER_BATCH_SIZE,
+        flush_interval: float = CHAT_WRITER_FLUSH_INTERVAL,
+        max_retries: int = CHAT_WRITER_MAX_RETRIES,
+        retry_backoff: float = 0.5,
+        spill_path: Optional[str] = CHAT_WRITER_SPILL_PATH,
+        dedupe_size: int = CHAT_WRITER_DEDUPE_SIZE
+    ):
+        self.table = table
+        self.batch_size = max(1, min(batch_size, AIRTABLE_MAX_BATCH_SIZE))
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.spill_path = spill_path
+        self.dedupe_size = dedupe_size
+
+        self._seen_keys: "OrderedDict[str, None]" = OrderedDict()
+        self._seen_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._spill_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='chat-history-writer', daemon=True)
+        self._thread.start()
+
+        # Records spilled by a previous process get another chance now
+        self._requeue_spilled()
+
+    def submit(self, record: Dict, idempotency_key: Optional[str] = None) -> None:
+        if idempotency_key is not None and self._seen(idempotency_key):
+            record_suppressed('history')
+            return
+        if self._closed:
+            # Writer already drained (interpreter shutting down), write straight through
+            self._flush([record])
+            return
+        self._queue.put(record)
+
+    def _seen(self, idempotency_key: str) -> bool:
+        with self._seen_lock:
+            if idempotency_key in self._seen_keys:
+                self._seen_keys.move_to_end(idempotency_key)
+                return True
+            self._seen_keys[idempotency_key] = None
+            while len(self._seen_keys) > self.dedupe_size:
+                self._seen_keys.popitem(last=False)
+            return False
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        batch: List[Dict] = []
+        deadline = 0.0
+
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                # Time trigger: the oldest buffered record has waited flush_interval
+                self._flush(batch)
+                batch = []
+                continue
+
+            if item is _STOP:
+                break
+
+            batch.append(item)
+            if len(batch) == 1:
+                deadline = time.monotonic() + self.flush_interval
+            if len(batch) >= self.batch_size:
+                # Size trigger
+                self._flush(batch)
+                batch = []
+
+        # Drain whatever is still buffered or queued before shutting down
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        for start in range(0, len(batch), self.batch_size):
+            self._flush(batch[start:start + self.batch_size])
+
+    def _flush(self, batch: List[Dict]) -> None:
+        if not batch:
+            return
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                with airtable_priority(PRIORITY_WRITE):
+                    self.table.batch_create(batch)
+                return
+            except Exception as e:
+                logger.warning(f"Error saving chat history batch (attempt {attempt + 1}): {str(e)}")
+                if attempt < self.max_retries:
+                    delay = self.retry_backoff * (2 ** attempt)
+                    time.sleep(delay + random.uniform(0, delay))
+
+        self._spill(batch)
+
+    def _spill(self, batch: List[Dict]) -> None:
+        if not self.spill_path:
+            logger.error(f"Dropping {len(batch)} chat history records, no spill file configured")
+            return
+        try:
+            with self._spill_lock, open(self.spill_path, 'a', encoding='utf-8') as f:
+                for record in batch:
+                    f.write(json.dumps(record) + '\n')
+        except Exception as e:
+            logger.error(f"Error spilling chat history to {self.spill_path}: {str(e)}")
+
+    def _requeue_spilled(self) -> None:
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        try:
+            with self._spill_lock:
+                with open(self.spill_path, encoding='utf-8') as f:
+                    records = [json.loads(line) for line in f if line.strip()]
+                os.remove(self.spill_path)
+        except Exception as e:
+            logger.error(f"Error reading spilled chat history from {self.spill_path}: {str(e)}")
+            return
+        for record in records:
+            self._queue.put(record)
+
+
+_writer: Optional[ChatHistoryWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_chat_writer(table) -> ChatHistoryWriter:
+    """Return the process-wide writer, creating it on first use with ``table``."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ChatHistoryWriter(table)
+                atexit.register(_writer.close)
+    return _writer
@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Set, Tuple
+
+import metrics
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+except Exception:  # optional, falls back to ~4 characters per token
+    _encoding = None
+
+# 0 disables trimming and sends the whole history
+HISTORY_TOKEN_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', 3000))
+# The summarised prefix only grows in steps of this many messages, so a summary is reused until the next step
+HISTORY_CUT_STEP = int(os.environ.get('HISTORY_CUT_STEP', 6))
+HISTORY_SUMMARY_CACHE_SIZE = int(os.environ.get('HISTORY_SUMMARY_CACHE_SIZE', 1024))
+# Summaries are built in the background on this many threads, shared by every HistoryWindow
+HISTORY_SUMMARY_WORKERS = int(os.environ.get('HISTORY_SUMMARY_WORKERS', 2))
+
+logger = logging.getLogger(__name__)
+
+# Tokens a chat message costs beyond its text (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Summarise the earlier part of this tutoring conversation between a student and DALA in a few sentences. "
+    "Keep the student's name, their project, what they asked and what was already explained.\n\n"
+    "{previous}{transcript}"
+)
+
+Summarizer = Callable[[Optional[str], Sequence], str]
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def message_text(message) -> str:
+    return message.message or message.content or ''
+
+
+def message_tokens(message) -> int:
+    return estimate_tokens(message_text(message)) + MESSAGE_OVERHEAD_TOKENS
+
+
+def build_summary_prompt(previous_summary: Optional[str], messages: Sequence) -> str:
+    transcript = '\n'.join(
+        f"{'Student' if message.type == 'userMessage' else 'DALA'}: {message_text(message)}" for message in messages
+    )
+    previous = f"Summary so far: {previous_summary}\n\n" if previous_summary else ''
+    return SUMMARY_PROMPT.format(previous=previous, transcript=transcript)
+
+
+class HistoryWindow:
+    """Keeps the most recent messages that fit in ``token_budget`` tokens.
+
+    Older messages are dropped, or replaced by a single summary message when a
+    ``summarizer(previous_summary, messages)`` is given. Summaries are cached
+    by the content of the summarised prefix and built incrementally from the
+    previous one, so each older message is summarised once. They are built in
+    the background: until a new one is ready, ``select`` sends the latest
+    summary it already has and never waits for the summarizer.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        summarizer: Optional[Summarizer] = None,
+        cut_step: int = HISTORY_CUT_STEP,
+        summary_cache_size: int = HISTORY_SUMMARY_CACHE_SIZE
+    ):
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.cut_step = max(1, cut_step)
+        self.summary_cache_size = summary_cache_size
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _cut_index(self, tokens: List[int], budget: int) -> Tuple[int, int]:
+        """Return ``(first message kept, end of the summarised prefix)``."""
+        suffix = [0] * (len(tokens) + 1)
+        for i in range(len(tokens) - 1, -1, -1):
+            suffix[i] = suffix[i + 1] + tokens[i]
+        boundary = 0
+        while suffix[boundary] > budget and boundary < len(tokens):
+            # Whole steps keep the summarised prefix, and so the summary, stable for several turns
+            boundary = min(len(tokens), boundary + self.cut_step)
+        # The window still takes every older message that fits, these may also be in the summary
+        cut = boundary
+        while cut > 0 and suffix[cut - 1] <= budget:
+            cut -= 1
+        if boundary % self.cut_step:
+            # No step boundary fits (the newest messages alone are over budget), summarise up to the cut
+            boundary = cut
+        return cut, boundary
+
+    def _prefix_digests(self, messages: Sequence, upto: int) -> List[tuple]:
+        """Chained digests of messages[:i] for every step boundary i <= upto."""
+        digests = []
+        digest = hashlib.sha256()
+        for i, message in enumerate(messages[:upto], start=1):
+            digest.update(f'{message.type}\0{message_text(message)}\0'.encode('utf-8'))
+            if i % self.cut_step == 0 or i == upto:
+                digests.append((i, digest.copy().hexdigest()))
+        return digests
+
+    def _summary(self, messages: Sequence, upto: int) -> Optional[str]:
+        """Summary of messages[:upto] if ready, else start it and return the latest shorter one."""
+        digests = self._prefix_digests(messages, upto)
+        key = digests[-1][1]
+        with self._lock:
+            if key in self._summaries:
+                self._summaries.move_to_end(key)
+                return self._summaries[key]
+            # Start from the longest prefix already summarised
+            start, previous = 0, None
+            for i, prefix_key in reversed(digests[:-1]):
+                if prefix_key in self._summaries:
+                    start, previous = i, self._summaries[prefix_key]
+                    break
+            if key not in self._pending:
+                self._pending.add(key)
+                _get_executor().submit(self._build_summary, key, previous, messages[start:upto])
+        return previous
+
+    def _build_summary(self, key: str, previous: Optional[str], messages: Sequence) -> None:
+        try:
+            with metrics.span('history_summary'):
+                summary = self.summarizer(previous, messages)
+        except Exception as e:
+            # The older turns stay dropped, the next select tries again
+            logger.warning(f"Error summarising conversation history: {str(e)}")
+            summary = None
+
+        with self._lock:
+            self._pending.discard(key)
+            if summary is not None:
+                self._summaries[key] = summary
+                while len(self._summaries) > self.summary_cache_size:
+                    self._summaries.popitem(last=False)
+
+    def select(self, messages: Optional[Sequence]) -> List:
+        messages = list(messages or [])
+        if self.token_budget <= 0 or not messages:
+            return messages
+
+        tokens = [message_tokens(m) for m in messages]
+        total = sum(tokens)
+        if total <= self.token_budget:
+            metrics.registry.observe('prediction_history_tokens', total, buckets=metrics.SIZE_BUCKETS)
+            return messages
+
+        budget = self.token_budget
+        summary = None
+        if self.summarizer is not None:
+            # Leave room for the summary itself
+            budget = self.token_budget * 3 // 4
+        cut, boundary = self._cut_index(tokens, budget)
+        window = messages[cut:]
+
+        if self.summarizer is not None and cut:
+            summary = self._summary(messages, boundary)
+
+        if summary:
+            # Imported here, flowise_test imports this module
+            from pages_section.flowise_test import IMessage
+            window.insert(0, IMessage(message=f"Summary of the earlier conversation: {summary}", type='apiMessage'))
+
+        metrics.registry.observe('prediction_history_tokens', sum(message_tokens(m) for m in window), buckets=metrics.SIZE_BUCKETS)
+        metrics.registry.inc('prediction_history_trimmed_total', summarized='yes' if summary else 'no')
+        return window
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=HISTORY_SUMMARY_WORKERS, thread_name_prefix='history-summary')
+    return _executor
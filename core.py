@@ -0,0 +1,609 @@
+"""Shared helpers for Home.py and the page scripts.
+
+Imported once per process, so it holds no per-session state and builds no
+clients at import time; the Airtable client is a cached resource.
+"""
+import os
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+
+import requests
+import streamlit as st
+import streamlit.components.v1 as components
+from pyairtable.formulas import match
+from streamlit.errors import StreamlitAPIException
+
+import metrics
+from admission import get_admission_controller
+from airtable_limiter import PRIORITY_LOGIN, RateLimitedApi, airtable_priority
+from answer_cache import get_answer_cache
+from chat_backends import get_chat_router
+from chat_store import get_chat_store, save_chat_record
+from chat_writer import get_chat_writer
+from file_uploads import UPLOAD_ALLOWED_TYPES, UPLOAD_MAX_BYTES, UploadRejected, check_upload, prepare_upload, unsent_files
+from http_session import get_http_session
+from idempotency import DeferredInterrupt, get_submission_registry, make_idempotency_key
+from response_codec import encode_response_json
+from session_backend import SESSION_TTL, get_session_backend, new_session_key, sign_session_key, verify_session_token
+from sse import EndEvent, ErrorEvent, MetadataEvent, TokenEvent, iter_flowise_events
+from user_cache import get_login_lookups, get_user_cache
+
+BASE_ID = os.environ.get('BASE_ID')
+USER_TABLE_NAME = 'Users'
+CHAT_TABLE_NAME = 'Chat History'
+# Non-secret Users fields, the only ones kept in the shared user cache
+USER_FIELDS = ['Username', 'StudentID']
+# Read fresh on every login, so password changes and lockouts apply at once
+LOGIN_FIELDS = ['Username', 'Password']
+AIRTABLE_API_KEY = os.environ.get('AIRTABLE_API_KEY')
+# Override to point at a proxy or a local stand-in (see benchmarks/)
+AIRTABLE_ENDPOINT_URL = os.environ.get('AIRTABLE_ENDPOINT_URL', 'https://api.airtable.com')
+
+def str_to_bool(str_input):
+    if not isinstance(str_input, str):
+        return False
+    return str_input.lower() == "true"
+
+# Stream Flowise replies token by token instead of waiting for the full answer
+FLOWISE_STREAMING = str_to_bool(os.environ.get("FLOWISE_STREAMING", "false"))
+
+# Messages rendered per page before "Load earlier messages", and the most kept in memory
+CHAT_WINDOW_SIZE = int(os.environ.get("CHAT_WINDOW_SIZE", 20))
+CHAT_LOG_MAX_MESSAGES = int(os.environ.get("CHAT_LOG_MAX_MESSAGES", 200))
+
+enabled_file_upload_message = os.environ.get(
+    "ENABLED_FILE_UPLOAD_MESSAGE", "Upload a file"
+)
+
+# Usernames allowed to see the Metrics page
+ADMIN_USERNAMES = {u.strip() for u in os.environ.get('ADMIN_USERNAMES', '').split(',') if u.strip()}
+
+SESSION_COOKIE_NAME = os.environ.get('SESSION_COOKIE_NAME', 'dala_session')
+# Also carry the signed session in the URL, for browsers that block the cookie
+SESSION_URL_FALLBACK = str_to_bool(os.environ.get('SESSION_URL_FALLBACK', 'false'))
+SESSION_QUERY_PARAM = 'sid'
+# Session state kept in the session backend, so a reconnect to any replica or a restart keeps it
+PERSISTED_SESSION_KEYS = [
+    'logged_in', 'username', 'session_id', 'flowise_session_id',
+    'page_chat_logs', 'page_chat_windows', 'page_thread_ids', 'backend_conversations',
+    'chat_submission_seq', 'pending_submission'
+]
+
+# Serve /metrics for Prometheus when METRICS_PORT is set (once per process)
+metrics.start_metrics_server()
+
+@st.cache_resource
+def get_airtable():
+    # One client per process, every request goes through the shared rate limiter
+    return RateLimitedApi(AIRTABLE_API_KEY, endpoint_url=AIRTABLE_ENDPOINT_URL)
+
+def generate_session_id():
+    return str(uuid.uuid4())
+
+def fetch_user(username, fields=USER_FIELDS):
+    table = get_airtable().table(BASE_ID, USER_TABLE_NAME)
+    # Logins outrank history writes when Airtable is busy
+    with airtable_priority(PRIORITY_LOGIN):
+        return table.first(formula=match({"Username": username}), fields=fields)
+
+def get_user(username):
+    with metrics.span('get_user') as span:
+        try:
+            # Shared across sessions, concurrent lookups for the same user make one request
+            user = get_user_cache().get(username, fetch_user)
+            if user is None:
+                span.set_outcome('not_found')
+            return user
+        except Exception as e:
+            span.set_outcome('error')
+            st.error(f"Error getting user: {str(e)}")
+            return None
+
+def get_login_user(username):
+    # Never cached, the password hash is only held for this check; simultaneous logins share one request
+    with metrics.span('get_login_user') as span:
+        try:
+            user = get_login_lookups().get(username, lambda name: fetch_user(name, fields=LOGIN_FIELDS))
+            if user is None:
+                span.set_outcome('not_found')
+            return user
+        except Exception as e:
+            span.set_outcome('error')
+            st.error(f"Error getting user: {str(e)}")
+            return None
+
+def get_student_id(username):
+    user = get_user(username)
+    if user:
+        return user['fields'].get('StudentID')
+    else:
+        return None
+
+def verify_password(stored_password, provided_password):
+    return stored_password == provided_password
+
+def restore_session_state():
+    """Load the persisted state of this browser's session, once per websocket session."""
+    if '_session_key' in st.session_state:
+        return
+
+    token = st.context.cookies.get(SESSION_COOKIE_NAME) or st.query_params.get(SESSION_QUERY_PARAM)
+    key = verify_session_token(token)
+    state = None
+    if key is not None:
+        try:
+            state = get_session_backend().load(key)
+        except Exception as e:
+            st.error(f"Error loading session: {str(e)}")
+    else:
+        key = new_session_key()
+
+    st.session_state['_session_key'] = key
+    st.session_state['_session_cookie_sent'] = token == sign_session_key(key)
+    if state:
+        for name, value in state.items():
+            st.session_state[name] = value
+
+def send_session_cookie():
+    if st.session_state.get('_session_cookie_sent', True):
+        return
+    token = sign_session_key(st.session_state['_session_key'])
+    # Streamlit has no response to attach Set-Cookie to, so the browser sets it
+    components.html(
+        f"""<script>
+        window.parent.document.cookie = "{SESSION_COOKIE_NAME}={token}; path=/; max-age={SESSION_TTL}; SameSite=Lax";
+        </script>""",
+        height=0
+    )
+    if SESSION_URL_FALLBACK:
+        st.query_params[SESSION_QUERY_PARAM] = token
+    st.session_state['_session_cookie_sent'] = True
+
+def persist_session_state():
+    key = st.session_state.get('_session_key')
+    if key is None:
+        return
+    state = {name: st.session_state[name] for name in PERSISTED_SESSION_KEYS if name in st.session_state}
+    digest = hashlib.sha1(json.dumps(state, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    # Most reruns change nothing worth writing
+    if st.session_state.get('_session_digest') == digest:
+        return
+    try:
+        get_session_backend().save(key, state)
+        st.session_state['_session_digest'] = digest
+    except Exception as e:
+        st.error(f"Error saving session: {str(e)}")
+
+def is_admin():
+    return st.session_state.get('logged_in', False) and st.session_state.get('username') in ADMIN_USERNAMES
+
+def disable_form():
+    st.session_state.in_progress = True
+
+def reset_chat():
+    current_page = st.session_state.get('current_page', 'Unknown Page')
+    if current_page in st.session_state.page_chat_logs:
+        st.session_state.page_chat_logs[current_page] = []
+    st.session_state.get('page_chat_windows', {}).pop(current_page, None)
+    st.session_state.in_progress = False
+
+def render_chat_markdown(msg):
+    # Close a code fence left open by a cut-off reply so it doesn't swallow the rest of the bubble
+    if msg.count("```") % 2:
+        msg += "\n```"
+    return msg
+
+def save_chat_history(session_id, username, user_input, response_json, idempotency_key=None):
+    with metrics.span('save_chat_history') as span:
+        try:
+            # Keep only the analysed fields (plus the compressed full payload if configured)
+            response_json_str = encode_response_json(response_json)
+            span.set_size(len(response_json_str))
+
+            record = {
+                "Timestamp": int(time.time()),
+                "SessionID": session_id,
+                "ResponseJSON": response_json_str, # Decode with response_codec.decode_response_json
+                "Username": username,
+                "UserInput": user_input
+            }
+
+            table = get_airtable().table(BASE_ID, CHAT_TABLE_NAME)
+            if get_chat_store(table) is not None:
+                # Write to the local SQLite store, a background worker replicates it to Airtable
+                save_chat_record(table, record, idempotency_key)
+            else:
+                # Queue the record for the background writer, which batches it into Airtable
+                get_chat_writer(table).submit(record, idempotency_key)
+        except Exception as e:
+            span.set_outcome('error')
+            st.error(f"Error saving chat history: {str(e)}")
+        
+def generate_custom_api_response(api_url, headers, question, uploads=None):
+    # Retrieve the session ID directly from the session state
+    session_id = st.session_state.get('flowise_session_id', None)
+
+    # Create the payload for the API request
+    payload = {
+        "question": question,
+        "streaming": False,  # Assuming the API supports streaming
+        "overrideConfig": {
+            "sessionId": session_id  # Directly use the session ID from session state
+        }
+    }
+    if uploads:
+        payload["uploads"] = [upload.__dict__ for upload in uploads]
+
+    with metrics.span('generate_custom_api_response') as span:
+        # Send the request to the custom API endpoint over the shared keep-alive session
+        try:
+            response = get_http_session().post(api_url, json=payload, headers=headers)
+        except requests.RequestException as e:
+            span.set_outcome('error')
+            st.error(f"Error contacting API: {str(e)}")
+            return None
+
+        # requests measures elapsed time up to the response headers
+        span.first_byte(response.elapsed.total_seconds())
+        span.set_size(len(response.content))
+
+        # Return the response content as JSON if status is 200 OK
+        if response.status_code == 200:
+            return response.json()
+        else:
+            span.set_outcome(f'http_{response.status_code}')
+            st.error(f"Error {response.status_code}: {response.text}")
+            return None
+
+def stream_custom_api_response(api_url, headers, question, on_token, uploads=None):
+    """Stream a Flowise prediction, calling ``on_token`` with the reply so far after each token.
+
+    Returns the response JSON rebuilt from the stream. On an HTTP error, an
+    error event or a dropped connection it reports the error and returns
+    ``None``: text already streamed is discarded, nothing is saved to Chat
+    History for that turn.
+    """
+    session_id = st.session_state.get('flowise_session_id', None)
+
+    payload = {
+        "question": question,
+        "streaming": True,
+        "overrideConfig": {
+            "sessionId": session_id
+        }
+    }
+    if uploads:
+        payload["uploads"] = [upload.__dict__ for upload in uploads]
+
+    # Rebuild the same shape as the non-streaming response JSON from the SSE events
+    response_json = {"text": ""}
+
+    with metrics.span('stream_custom_api_response') as span:
+        try:
+            with get_http_session().post(api_url, json=payload, headers=headers, stream=True) as response:
+                span.first_byte(response.elapsed.total_seconds())
+                if response.status_code != 200:
+                    span.set_outcome(f'http_{response.status_code}')
+                    st.error(f"Error {response.status_code}: {response.text}")
+                    return None
+
+                # Chatflows that can't stream answer with a plain JSON body
+                if not response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                    response_json = response.json()
+                    span.set_size(len(response.content))
+                    on_token(response_json.get('text', ''))
+                    return response_json
+
+                for event in iter_flowise_events(response.iter_content(chunk_size=None)):
+                    if isinstance(event, TokenEvent):
+                        if event.data:
+                            response_json['text'] += event.data
+                            on_token(response_json['text'])
+                    elif isinstance(event, MetadataEvent):
+                        # chatId, chatMessageId, question, sessionId, ...
+                        response_json.update(event.data or {})
+                    elif isinstance(event, ErrorEvent):
+                        span.set_outcome('error')
+                        st.error(f"Error from API: {event.data}")
+                        return None
+                    elif isinstance(event, EndEvent):
+                        break
+                    elif event.event != 'start':
+                        # sourceDocuments, usedTools, agentReasoning, ...
+                        response_json[event.event] = event.data
+        except requests.RequestException as e:
+            span.set_outcome('error')
+            st.error(f"Error contacting API: {str(e)}")
+            return None
+
+        span.set_size(len(response_json['text'].encode('utf-8')))
+        return response_json
+
+def load_flowise_chat_screen(api_url, headers, assistant_title, assistant_message, streaming=None):
+    if streaming is None:
+        streaming = FLOWISE_STREAMING
+
+    # Hedged Flowise/secondary routing, only when CHAT_SECONDARY_BACKEND is set
+    router = get_chat_router(api_url, headers)
+
+    def get_current_page():
+        return st.session_state.get('current_page', 'Flowise Chat')
+
+    def initialize_chat_logs(current_page):
+        if 'page_chat_logs' not in st.session_state:
+            st.session_state.page_chat_logs = {}
+        if current_page not in st.session_state.page_chat_logs:
+            st.session_state.page_chat_logs[current_page] = []
+
+    def load_earlier_messages(current_page):
+        windows = st.session_state.setdefault('page_chat_windows', {})
+        windows[current_page] = windows.get(current_page, CHAT_WINDOW_SIZE) + CHAT_WINDOW_SIZE
+
+    def display_chat_log(current_page):
+        chat_log = st.session_state.page_chat_logs[current_page]
+        window = st.session_state.get('page_chat_windows', {}).get(current_page, CHAT_WINDOW_SIZE)
+
+        # Only the most recent messages are replayed on each rerun
+        hidden = len(chat_log) - window
+        if hidden > 0:
+            st.button(
+                f"Load earlier messages ({hidden} more)",
+                key=f"load_earlier_{current_page}",
+                on_click=load_earlier_messages,
+                args=(current_page,)
+            )
+
+        for chat in chat_log[-window:]:
+            with st.chat_message(chat["name"]):
+                st.markdown(render_chat_markdown(chat["msg"]), True)
+
+    def append_chat_message(current_page, name, msg):
+        chat_log = st.session_state.page_chat_logs[current_page]
+        chat_log.append({"name": name, "msg": msg})
+        # Evict the oldest messages, the full conversation is kept in Chat History
+        if len(chat_log) > CHAT_LOG_MAX_MESSAGES:
+            del chat_log[:len(chat_log) - CHAT_LOG_MAX_MESSAGES]
+
+    def interrupted_message(current_page):
+        # A rerun (e.g. "Load earlier messages") stopped the last submission before it was answered
+        pending = st.session_state.get('pending_submission')
+        if pending is None or pending["page"] != current_page or pending["seq"] != st.session_state.get('chat_submission_seq'):
+            return None
+        if st.session_state.page_chat_logs[current_page][-1:] != [{"name": "user", "msg": pending["msg"]}]:
+            return None
+        return pending["msg"]
+
+    def queue_message(position):
+        return f"Many students are asking DALA right now, you are number {position} in the queue..."
+
+    def update_session_id_if_needed(response_json):
+        if 'sessionId' in response_json and st.session_state.get('flowise_session_id') is None:
+            st.session_state['flowise_session_id'] = response_json['sessionId']
+
+    def rerun_chat_area():
+        # Re-enable the input and replay the log without re-running navigation and the banner
+        try:
+            st.rerun(scope="fragment")
+        except StreamlitAPIException:
+            # The fragment was executed as part of a full-app run
+            st.rerun()
+
+    def process_user_input(user_msg, current_page):
+        st.session_state.in_progress = True
+        # Exceptions (e.g. from a backend) finish the span as an error
+        with metrics.span('process_user_input') as span:
+            # Double sends, reconnects and interrupted reruns resubmit the same message. Without
+            # a session key two sessions could share a key, so those are never deduplicated.
+            submissions = get_submission_registry()
+            session_key = st.session_state.get('_session_key')
+            submission_seq = st.session_state.setdefault('chat_submission_seq', 0)
+            submission_key = make_idempotency_key(session_key, current_page, submission_seq, user_msg) if session_key else None
+            submission = {"page": current_page, "seq": submission_seq, "msg": user_msg}
+            chat_log = st.session_state.page_chat_logs[current_page]
+            resubmitted = (
+                st.session_state.get('pending_submission') == submission
+                and chat_log[-1:] == [{"name": "user", "msg": user_msg}]
+            )
+
+            # Display user message, an interrupted run already added it to the log
+            if not resubmitted:
+                with st.chat_message("user"):
+                    st.markdown(user_msg, True)
+
+            # Position of this question in the conversation, used by the answer cache
+            turn = sum(1 for chat in chat_log if chat["name"] == "user") - (1 if resubmitted else 0)
+
+            # Save user message to chat log
+            if not resubmitted:
+                append_chat_message(current_page, "user", user_msg)
+            # Finished by the next run if this one is interrupted
+            st.session_state.pending_submission = submission
+
+            # Retrieve session-related variables
+            session_id = st.session_state.get('flowise_session_id', None)
+            username = st.session_state.get('username', 'Unknown User')
+
+            # Files selected in the sidebar go with the next message only, each distinct file is encoded once per session
+            uploads = []
+            upload_cache = st.session_state.setdefault('upload_cache', OrderedDict())
+            sent_upload_ids = st.session_state.setdefault('sent_upload_ids', set())
+            new_files = unsent_files(st.session_state.get('flowise_uploads'), sent_upload_ids)
+            for uploaded_file in new_files:
+                try:
+                    uploads.append(prepare_upload(uploaded_file, upload_cache))
+                except UploadRejected:
+                    continue  # already reported under the uploader
+
+            # Repeated questions are answered from the shared cache when it is enabled
+            answer_cache = get_answer_cache() if not uploads else None
+            cached_json = answer_cache.get(api_url, user_msg, turn) if answer_cache else None
+            conversations = st.session_state.setdefault('backend_conversations', {})
+            conversations.setdefault('flowise', session_id or None)
+
+            # Show AI response with "default" name for the default style (yellow bubble)
+            with st.chat_message("🤖"):
+                reply_placeholder = st.empty()
+                reply_placeholder.markdown("_AI is thinking..._")
+
+            def render_partial_reply(text):
+                span.first_byte()
+                reply_placeholder.markdown(text + " ▌", True)
+
+            # A rerun raised while rendering waits until the prediction is stored for the next run
+            interrupt = DeferredInterrupt()
+            on_token = interrupt.wrap(render_partial_reply) if streaming else None
+            on_wait = interrupt.wrap(lambda position: reply_placeholder.markdown(queue_message(position)))
+            on_admitted = interrupt.wrap(lambda: reply_placeholder.markdown("_AI is thinking..._"))
+            router_errors = []
+
+            def fetch_response():
+                # Nothing is rendered directly in here, see DeferredInterrupt
+                if cached_json:
+                    return cached_json
+                with get_admission_controller().admit(username, on_wait=on_wait):
+                    on_admitted()
+                    if router is not None:
+                        # The router hands streamed tokens back to this thread, so they render as they arrive
+                        try:
+                            return router.ask(user_msg, conversations, uploads=uploads, on_token=on_token)
+                        except Exception as e:
+                            router_errors.append(e)
+                            return None
+                    if streaming:
+                        return stream_custom_api_response(api_url, headers, user_msg, on_token=on_token, uploads=uploads)
+                    return generate_custom_api_response(api_url, headers, user_msg, uploads=uploads)
+
+            # Identical submissions in flight or just sent share one prediction
+            if submission_key is not None:
+                response_json, history_key, duplicate = submissions.run(submission_key, fetch_response)
+            else:
+                response_json, history_key, duplicate = fetch_response(), None, False
+            if interrupt.exception is not None:
+                st.session_state.in_progress = False
+                span.finish('interrupted')
+                raise interrupt.exception
+
+            for e in router_errors:
+                st.error(f"Error contacting API: {str(e)}")
+            if response_json:
+                span.first_byte()
+                reply_placeholder.markdown(response_json.get('text') or "No response received.", True)
+            else:
+                reply_placeholder.empty()
+
+            if response_json:
+                update_session_id_if_needed(response_json)
+                sent_upload_ids.update(f.file_id for f in new_files)
+                if answer_cache and not cached_json and not duplicate:
+                    answer_cache.put(api_url, user_msg, turn, response_json)
+
+                flowise_reply = response_json.get('text') or "No response received."
+
+                # Save AI reply to chat log
+                append_chat_message(current_page, "🤖", flowise_reply)
+
+                # Call save_chat_history to queue the interaction for saving
+                try:
+                    save_chat_history(
+                        session_id=session_id,
+                        username=username,
+                        user_input=user_msg,
+                        response_json=response_json,
+                        idempotency_key=history_key
+                    )
+                except Exception as e:
+                    st.error(f"Error saving chat history: {str(e)}")
+
+            # Only a submission that ran to the end moves on, sending the message again is then a new one
+            st.session_state.chat_submission_seq = submission_seq + 1
+            st.session_state.pop('pending_submission', None)
+            st.session_state.in_progress = False
+            span.set_outcome('ok' if response_json else 'error')
+        # Fragment reruns skip main(), so save the new messages here
+        persist_session_state()
+        if response_json and new_files:
+            # The sidebar still lists these files as unsent, and it is outside the fragment
+            st.rerun()
+        rerun_chat_area()
+
+    # Main Logic Execution
+    current_page = get_current_page()
+
+    # Initialize UI Components
+    uploaded_files = st.sidebar.file_uploader(
+        f"Upload a file if needed ({', '.join(UPLOAD_ALLOWED_TYPES)})",
+        type=UPLOAD_ALLOWED_TYPES,
+        accept_multiple_files=True,
+        key='flowise_uploads',
+        help=f"Up to {UPLOAD_MAX_BYTES / 1024 / 1024:g} MB per file",
+        disabled=st.session_state.get('in_progress', False),
+    )
+    # Reject oversized files from their reported size, before anything reads them
+    for uploaded_file in uploaded_files or []:
+        try:
+            check_upload(uploaded_file.name, uploaded_file.size)
+        except UploadRejected as e:
+            st.sidebar.error(str(e))
+    pending_files = unsent_files(uploaded_files, st.session_state.setdefault('sent_upload_ids', set()))
+    if pending_files:
+        st.sidebar.caption(f"Sent with your next message: {', '.join(f.name for f in pending_files)}")
+
+    initialize_chat_logs(current_page)
+
+    st.title(assistant_title or "")
+    st.info(assistant_message)
+    st.write("Halo, bisa perkenalkan namamu?")  
+
+    @st.fragment
+    def chat_area():
+        # Sending a message or loading earlier ones only re-executes this fragment
+        display_chat_log(current_page)
+
+        user_msg = st.chat_input("Message", disabled=st.session_state.get('in_progress', False))
+        if not user_msg:
+            user_msg = interrupted_message(current_page)
+
+        if user_msg:
+            process_user_input(user_msg, current_page)
+
+    chat_area()
+
+def login():
+    st.title("DALA RevoU")
+    st.markdown("For login, use the registered email in RevoU with your phone number with format `081xxx` as password")
+    username = st.text_input("Username")
+    password = st.text_input("Password", type="password")
+    if st.button("Login"):
+        user = get_login_user(username)
+        if user:
+            if 'Password' in user['fields']:
+                if verify_password(user['fields']['Password'], password):
+                    st.session_state['logged_in'] = True
+                    st.session_state['username'] = username
+                    st.success("Login successful!")
+                    st.rerun()
+                else:
+                    st.error("Invalid password")
+            else:
+                st.error("User record does not contain a password field")
+        else:
+            st.error("User not found")
+
+def logout():
+    st.session_state['logged_in'] = False
+    st.session_state.pop('username', None)
+    st.session_state['chat_history'] = []
+    st.session_state['session_id'] = []
+    st.session_state['flowise_session_id'] = []
+    st.session_state.page_thread_ids = {}
+    st.session_state.page_chat_logs = {}
+    st.session_state.page_chat_windows = {}
+    st.session_state.pop('upload_cache', None)
+    st.session_state.pop('sent_upload_ids', None)
+    st.session_state.pop('backend_conversations', None)
+    st.success("Logged out successfully!")
+    reset_chat()
+    st.rerun()
@@ -0,0 +1,228 @@
+"""Export the Airtable Chat History table to Parquet for analytics.
+
+Records are fetched one API page at a time and written in fixed-size row
+groups, so memory stays flat however large the table is. With
+``--watermark-file`` each run only exports records Airtable created since
+the previous run.
+
+The watermark is Airtable's own createdTime, not the Timestamp field: chat
+rows reach Airtable through a background sync, so a row can arrive after an
+export with a Timestamp older than that export's newest one. Each run also
+re-reads an ``--overlap`` window before the watermark and skips the record
+ids the previous run already exported from it, so a record_id is exported
+once across runs.
+
+    python export_chat_history.py --output exports/ --watermark-file exports/.watermark
+    python export_chat_history.py --since 1735689600 --full-response
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from airtable_limiter import RateLimitedApi
+from response_codec import decode_response_json
+
+BASE_ID = os.environ.get('BASE_ID')
+CHAT_TABLE_NAME = 'Chat History'
+AIRTABLE_API_KEY = os.environ.get('AIRTABLE_API_KEY')
+AIRTABLE_ENDPOINT_URL = os.environ.get('AIRTABLE_ENDPOINT_URL', 'https://api.airtable.com')
+
+# Airtable's maximum page size
+PAGE_SIZE = 100
+ROW_GROUP_SIZE = 10000
+# Re-read before the watermark, covers clock skew and records committed while the previous run paged
+OVERLAP_SECONDS = 600
+# Airtable's createdTime format, which also sorts as a string
+CREATED_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+SCHEMA = pa.schema([
+    ('record_id', pa.string()),
+    ('created_time', pa.string()),
+    ('timestamp', pa.int64()),
+    ('session_id', pa.string()),
+    ('username', pa.string()),
+    ('user_input', pa.string()),
+    ('answer', pa.string()),
+    ('chat_id', pa.string()),
+    ('chat_message_id', pa.string()),
+    ('flowise_session_id', pa.string()),
+    ('cache_hit', pa.bool_()),
+    # Whole decoded response as JSON, only filled with --full-response
+    ('response_json', pa.string()),
+])
+
+
+def format_created_time(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).strftime(CREATED_TIME_FORMAT)[:-3] + 'Z'
+
+
+def parse_created_time(value: str) -> datetime:
+    return datetime.strptime(value.rstrip('Z'), CREATED_TIME_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def iter_chat_records(table, created_since: Optional[str] = None, page_size: int = PAGE_SIZE) -> Iterator[Dict]:
+    """Yield Chat History records created at or after ``created_since``, fetching one page at a time."""
+    options = {'page_size': page_size}
+    if created_since is not None:
+        options['formula'] = f"NOT(IS_BEFORE(CREATED_TIME(), DATETIME_PARSE('{created_since}')))"
+    for page in table.iterate(**options):
+        yield from page
+
+
+class Watermark:
+    """Newest createdTime exported, and the ids of the records created in the overlap window before it."""
+
+    def __init__(self, overlap: float = OVERLAP_SECONDS, recent: Optional[Iterable] = None):
+        self.overlap = overlap
+        # [createdTime, record_id] pairs, pruned to the overlap window
+        self.recent: List[List[str]] = [list(pair) for pair in recent or []]
+        self.created_time = max((created for created, _ in self.recent), default=None)
+
+    def start(self) -> Optional[str]:
+        """Where the next run should start reading."""
+        if self.created_time is None:
+            return None
+        return format_created_time(parse_created_time(self.created_time) - timedelta(seconds=self.overlap))
+
+    def exported_ids(self) -> Set[str]:
+        return {record_id for _, record_id in self.recent}
+
+    def add(self, created_time: str, record_id: str) -> None:
+        self.recent.append([created_time, record_id])
+        if self.created_time is None or created_time > self.created_time:
+            self.created_time = created_time
+        # Pruned in bulk, the list stays within about twice the window
+        if len(self.recent) >= 2 * PAGE_SIZE and len(self.recent) % PAGE_SIZE == 0:
+            self.prune()
+
+    def prune(self) -> None:
+        cutoff = self.start()
+        if cutoff is not None:
+            self.recent = [pair for pair in self.recent if pair[0] >= cutoff]
+
+    def to_json(self) -> Dict:
+        self.prune()
+        return {'created_time': self.created_time, 'recent': self.recent}
+
+
+def to_row(record: Dict, full_response: bool = False) -> Dict:
+    fields = record.get('fields', {})
+    # Decoded per row and dropped right after, the full payload only when asked for
+    response = decode_response_json(fields.get('ResponseJSON'), full=full_response) or {}
+    if not isinstance(response, dict):
+        response = {'text': str(response)}
+    return {
+        'record_id': record.get('id'),
+        'created_time': record.get('createdTime'),
+        'timestamp': fields.get('Timestamp'),
+        'session_id': fields.get('SessionID'),
+        'username': fields.get('Username'),
+        'user_input': fields.get('UserInput'),
+        'answer': response.get('text'),
+        'chat_id': response.get('chatId'),
+        'chat_message_id': response.get('chatMessageId'),
+        'flowise_session_id': response.get('sessionId'),
+        'cache_hit': response.get('cacheHit'),
+        'response_json': json.dumps(response) if full_response else None,
+    }
+
+
+def write_parquet(rows: Iterator[Dict], path: str, row_group_size: int = ROW_GROUP_SIZE) -> Dict:
+    """Write ``rows`` to ``path`` one row group at a time and return the row count."""
+    written = 0
+    columns: Dict[str, List] = {name: [] for name in SCHEMA.names}
+
+    tmp_path = path + '.partial'
+    with pq.ParquetWriter(tmp_path, SCHEMA, compression='zstd') as writer:
+        def flush():
+            writer.write_table(pa.Table.from_pydict(columns, schema=SCHEMA), row_group_size=row_group_size)
+            for values in columns.values():
+                values.clear()
+
+        for row in rows:
+            for name, values in columns.items():
+                values.append(row[name])
+            written += 1
+            if len(columns['record_id']) >= row_group_size:
+                flush()
+        if columns['record_id']:
+            flush()
+
+    if written:
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+    return {'rows': written, 'path': path if written else None}
+
+
+def read_watermark(path: Optional[str], overlap: float = OVERLAP_SECONDS) -> Watermark:
+    if not path or not os.path.exists(path):
+        return Watermark(overlap)
+    with open(path, encoding='utf-8') as f:
+        value = f.read().strip()
+    if not value:
+        return Watermark(overlap)
+    return Watermark(overlap, json.loads(value).get('recent'))
+
+
+def write_watermark(path: str, watermark: Watermark) -> None:
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(watermark.to_json(), f)
+    os.replace(tmp_path, path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='exports', help='output .parquet file or directory')
+    parser.add_argument('--since', type=int, help='only export records created in Airtable at or after this (unix seconds)')
+    parser.add_argument('--watermark-file', help='resume from and store the newest exported createdTime in this file')
+    parser.add_argument('--overlap', type=float, default=OVERLAP_SECONDS, help='seconds re-read before the watermark')
+    parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE, help='rows buffered per Parquet row group')
+    parser.add_argument('--full-response', action='store_true', help='also export the full decoded ResponseJSON')
+    args = parser.parse_args(argv)
+
+    watermark = read_watermark(args.watermark_file, args.overlap)
+    if args.since is not None:
+        since = format_created_time(datetime.fromtimestamp(args.since, timezone.utc))
+    else:
+        since = watermark.start()
+    exported_ids = watermark.exported_ids()
+
+    output = args.output
+    if not output.endswith('.parquet'):
+        os.makedirs(output, exist_ok=True)
+        start = int(parse_created_time(since).timestamp()) if since else 0
+        output = os.path.join(output, f'chat_history_{start}_{int(time.time())}.parquet')
+
+    def new_records() -> Iterator[Dict]:
+        for record in iter_chat_records(table, since):
+            # Already exported by the previous run, from the overlap window
+            if record['id'] in exported_ids:
+                continue
+            watermark.add(record['createdTime'], record['id'])
+            yield record
+
+    table = RateLimitedApi(AIRTABLE_API_KEY, endpoint_url=AIRTABLE_ENDPOINT_URL).table(BASE_ID, CHAT_TABLE_NAME)
+    rows = (to_row(record, args.full_response) for record in new_records())
+    result = write_parquet(rows, output, args.row_group_size)
+
+    if args.watermark_file and result['rows']:
+        write_watermark(args.watermark_file, watermark)
+
+    if result['rows']:
+        print(f"Exported {result['rows']} records to {result['path']} (newest createdTime {watermark.created_time})")
+    else:
+        print(f"No records created since {since}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import base64
+import hashlib
+import os
+from collections import OrderedDict
+from typing import TYPE_CHECKING, BinaryIO, List, MutableMapping, MutableSet, Optional
+
+if TYPE_CHECKING:
+    from pages_section.flowise_test import IFileUpload
+
+# Checked against the size Streamlit reports, before the file is read
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 5 * 1024 * 1024))
+UPLOAD_ALLOWED_TYPES = [
+    t.strip().lower() for t in os.environ.get(
+        'UPLOAD_ALLOWED_TYPES', 'txt,pdf,json,csv,png,jpg,jpeg'
+    ).split(',') if t.strip()
+]
+# Flowise upload type for non-image files: file:full puts the whole file in the prompt, file:rag indexes it
+UPLOAD_FILE_TYPE = os.environ.get('UPLOAD_FILE_TYPE', 'file:full')
+# Encoded uploads kept per session, keyed by content hash
+UPLOAD_CACHE_ENTRIES = int(os.environ.get('UPLOAD_CACHE_ENTRIES', 4))
+
+# Multiple of 3 so every chunk encodes to whole base64 quanta without padding
+CHUNK_SIZE = 3 * 64 * 1024
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+def check_upload(name: str, size: int, max_bytes: int = UPLOAD_MAX_BYTES, allowed_types: List[str] = UPLOAD_ALLOWED_TYPES) -> None:
+    extension = os.path.splitext(name)[1].lstrip('.').lower()
+    if extension not in allowed_types:
+        raise UploadRejected(f"{name}: .{extension} files are not supported ({', '.join(allowed_types)})")
+    if size > max_bytes:
+        raise UploadRejected(f"{name}: file is {size / 1024 / 1024:.1f} MB, the limit is {max_bytes / 1024 / 1024:.1f} MB")
+
+
+def hash_file(f: BinaryIO, chunk_size: int = CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    f.seek(0)
+    while True:
+        n = f.readinto(buffer)
+        if not n:
+            break
+        digest.update(view[:n])
+    f.seek(0)
+    return digest.hexdigest()
+
+
+def encode_data_url(f: BinaryIO, size: int, mime: str, chunk_size: int = CHUNK_SIZE) -> str:
+    """Base64-encode ``f`` into a data URL, one chunk at a time.
+
+    The file is read one chunk at a time into a single preallocated buffer
+    for the encoded output, so the raw file is never held whole. Decoding
+    that buffer to the returned string copies it, so both exist briefly at
+    return, about twice the encoded size.
+    """
+    prefix = f"data:{mime};base64,".encode('ascii')
+    out = bytearray(len(prefix) + 4 * ((size + 2) // 3))
+    out[:len(prefix)] = prefix
+    pos = len(prefix)
+
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    f.seek(0)
+    while True:
+        n = f.readinto(buffer)
+        if not n:
+            break
+        encoded = base64.b64encode(view[:n])
+        out[pos:pos + len(encoded)] = encoded
+        pos += len(encoded)
+    f.seek(0)
+
+    if pos != len(out):
+        # The file changed size while being read
+        del out[pos:]
+    return out.decode('ascii')
+
+
+def upload_type(mime: str) -> str:
+    return 'file' if mime.startswith('image/') else UPLOAD_FILE_TYPE
+
+
+def prepare_upload(uploaded_file, cache: Optional[MutableMapping] = None) -> 'IFileUpload':
+    """Turn a Streamlit ``UploadedFile`` into a Flowise upload, reusing ``cache`` for repeated files."""
+    # flowise_test pulls in httpx, only worth importing once a file is attached
+    from pages_section.flowise_test import IFileUpload
+
+    check_upload(uploaded_file.name, uploaded_file.size)
+    mime = uploaded_file.type or 'application/octet-stream'
+
+    key = hash_file(uploaded_file)
+    if cache is not None and key in cache:
+        data = cache[key]
+        if isinstance(cache, OrderedDict):
+            cache.move_to_end(key)
+    else:
+        data = encode_data_url(uploaded_file, uploaded_file.size, mime)
+        if cache is not None:
+            cache[key] = data
+            while len(cache) > UPLOAD_CACHE_ENTRIES:
+                cache.pop(next(iter(cache)))
+
+    return IFileUpload(data=data, type=upload_type(mime), name=uploaded_file.name, mime=mime)
+
+
+def prepare_uploads(uploaded_files, cache: Optional[MutableMapping] = None) -> List['IFileUpload']:
+    return [prepare_upload(f, cache) for f in uploaded_files or []]
+
+
+def unsent_files(uploaded_files, sent_ids: MutableSet[str]) -> List:
+    """Selected files not attached to a message yet; each file goes with one message only.
+
+    Add a file's ``file_id`` to ``sent_ids`` once its message was answered.
+    Removing a file from the uploader forgets it, so re-adding it sends it again.
+    """
+    files = list(uploaded_files or [])
+    sent_ids.intersection_update(f.file_id for f in files)
+    return [f for f in files if f.file_id not in sent_ids]
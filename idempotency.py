@@ -0,0 +1,126 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+import metrics
+from answer_cache import normalize_question
+
+# How long after it was first sent a submission with the same key shares its prediction
+IDEMPOTENCY_WINDOW = float(os.environ.get('IDEMPOTENCY_WINDOW', 15))
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', 4096))
+
+
+def make_idempotency_key(session_key: str, page: str, submission: int, message: str) -> str:
+    """Same session, page, submission number and (normalised) message give the same key.
+
+    ``submission`` counts the messages the session has finished handling, so
+    a message sent again after its answer is a new submission, while a rerun
+    of one that was interrupted is not.
+    """
+    return hashlib.sha256(
+        f'{session_key}\0{page}\0{submission}\0{normalize_question(message)}'.encode('utf-8')
+    ).hexdigest()
+
+
+def record_suppressed(stage: str) -> None:
+    metrics.registry.inc('duplicate_submissions_suppressed_total', stage=stage)
+
+
+class DeferredInterrupt:
+    """Holds back exceptions raised by UI callbacks called during a prediction.
+
+    Streamlit stops a run for a rerun by raising from the next ``st.*`` call,
+    e.g. from a token callback. Wrapped callbacks keep that exception (and
+    skip any later rendering) so the prediction can finish and be stored
+    first; the caller raises ``exception`` afterwards.
+    """
+
+    def __init__(self):
+        self.exception: Optional[BaseException] = None
+
+    def wrap(self, callback: Callable) -> Callable:
+        def wrapped(*args):
+            if self.exception is not None:
+                return
+            try:
+                callback(*args)
+            except BaseException as e:
+                self.exception = e
+        return wrapped
+
+
+class _Submission:
+    def __init__(self, key: str):
+        self.started_at = time.time()
+        # Stored with the history record, a later genuine repeat gets a new one
+        self.idempotency_key = f'{key}:{int(self.started_at * 1000)}'
+        self.event = threading.Event()
+        self.result: Any = None
+        self.failed = False
+
+
+class SubmissionRegistry:
+    """Single-flight for chat submissions keyed by ``make_idempotency_key``.
+
+    The first submission of a key runs the prediction; identical submissions
+    while it runs, or within ``window`` seconds of it being sent, get its
+    result instead of running another one. ``fn`` must not render anything
+    except through ``DeferredInterrupt`` callbacks, or an interrupted run
+    loses its result.
+    """
+
+    def __init__(self, window: float = IDEMPOTENCY_WINDOW, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.window = window
+        self.max_entries = max_entries
+        self._submissions: "OrderedDict[str, _Submission]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _current(self, key: str) -> Optional[_Submission]:
+        submission = self._submissions.get(key)
+        if submission is None:
+            return None
+        if submission.event.is_set() and (submission.failed or submission.started_at + self.window <= time.time()):
+            del self._submissions[key]
+            return None
+        return submission
+
+    def run(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, str, bool]:
+        """Return ``(result, history idempotency key, duplicate)``."""
+        while True:
+            with self._lock:
+                submission = self._current(key)
+                is_leader = submission is None
+                if is_leader:
+                    submission = self._submissions[key] = _Submission(key)
+                    while len(self._submissions) > self.max_entries:
+                        self._submissions.popitem(last=False)
+
+            if is_leader:
+                break
+            submission.event.wait()
+            if not submission.failed:
+                record_suppressed('prediction')
+                return submission.result, submission.idempotency_key, True
+            # The first run failed, try again ourselves
+
+        try:
+            submission.result = fn()
+        except BaseException:
+            submission.failed = True
+            raise
+        finally:
+            # A failed prediction is not shared, the student can simply send the message again
+            if submission.result is None:
+                submission.failed = True
+            submission.event.set()
+        return submission.result, submission.idempotency_key, False
+
+
+_registry = SubmissionRegistry()
+
+
+def get_submission_registry() -> SubmissionRegistry:
+    return _registry
@@ -0,0 +1,220 @@
+import bisect
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+METRICS_PORT = os.environ.get('METRICS_PORT')
+METRICS_RATE_WINDOW_MINUTES = int(os.environ.get('METRICS_RATE_WINDOW_MINUTES', 15))
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the last finite bound for +Inf)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """In-process histograms, counters, gauges and rolling per-minute rates."""
+
+    def __init__(self, rate_window_minutes: int = METRICS_RATE_WINDOW_MINUTES):
+        self.rate_window_minutes = rate_window_minutes
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, LabelSet], Histogram] = {}
+        self._counters: Dict[Tuple[str, LabelSet], float] = defaultdict(float)
+        self._gauges: Dict[Tuple[str, LabelSet], float] = {}
+        # (span, outcome) -> deque of [minute, count]
+        self._minutes: Dict[Tuple[str, str], deque] = defaultdict(lambda: deque(maxlen=self.rate_window_minutes))
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = DURATION_BUCKETS, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        with self._lock:
+            self._counters[(name, _labels(labels))] += value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def mark(self, span: str, outcome: str) -> None:
+        minute = int(time.time() // 60)
+        with self._lock:
+            window = self._minutes[(span, outcome)]
+            if window and window[-1][0] == minute:
+                window[-1][1] += 1
+            else:
+                window.append([minute, 1])
+
+    def per_minute_rates(self) -> List[Dict]:
+        """One row per (span, outcome, minute) in the rolling window, newest first."""
+        oldest = int(time.time() // 60) - self.rate_window_minutes
+        rows = []
+        with self._lock:
+            for (span, outcome), window in self._minutes.items():
+                for minute, count in window:
+                    if minute > oldest:
+                        rows.append({'span': span, 'outcome': outcome, 'minute': minute * 60, 'count': count})
+        rows.sort(key=lambda row: (-row['minute'], row['span'], row['outcome']))
+        return rows
+
+    def histogram_summaries(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': h.count,
+                    'mean': h.sum / h.count if h.count else 0.0,
+                    'p50': h.quantile(0.5),
+                    'p95': h.quantile(0.95),
+                    'p99': h.quantile(0.99),
+                }
+                for (name, labels), h in sorted(self._histograms.items())
+            ]
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f'dala_{name}{_format_labels(labels)} {value:g}')
+            for (name, labels), value in sorted(self._gauges.items()):
+                lines.append(f'dala_{name}{_format_labels(labels)} {value:g}')
+            for (name, labels), h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'dala_{name}_bucket{_format_labels(labels + (("le", f"{bound:g}"),))} {cumulative}')
+                lines.append(f'dala_{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {h.count}')
+                lines.append(f'dala_{name}_sum{_format_labels(labels)} {h.sum:g}')
+                lines.append(f'dala_{name}_count{_format_labels(labels)} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels: Dict) -> LabelSet:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: LabelSet) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+registry = MetricsRegistry()
+
+
+class Span:
+    """Times one operation: total duration, time to first byte, payload size and outcome.
+
+    Use as a context manager (exceptions mark the outcome ``error``) or call
+    ``finish()`` explicitly, e.g. from a generator's ``finally`` block.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.outcome = 'ok'
+        self.payload_bytes: Optional[int] = None
+        self.ttfb: Optional[float] = None
+        self._started = time.perf_counter()
+        self._finished = False
+
+    def first_byte(self, seconds: Optional[float] = None) -> None:
+        if self.ttfb is None:
+            self.ttfb = seconds if seconds is not None else time.perf_counter() - self._started
+
+    def set_size(self, payload_bytes: int) -> None:
+        self.payload_bytes = payload_bytes
+
+    def set_outcome(self, outcome: str) -> None:
+        self.outcome = outcome
+
+    def finish(self, outcome: Optional[str] = None) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        if outcome is not None:
+            self.outcome = outcome
+
+        registry.observe(f'{self.name}_duration_seconds', time.perf_counter() - self._started, outcome=self.outcome)
+        if self.ttfb is not None:
+            registry.observe(f'{self.name}_ttfb_seconds', self.ttfb)
+        if self.payload_bytes is not None:
+            registry.observe(f'{self.name}_payload_bytes', self.payload_bytes, buckets=SIZE_BUCKETS)
+        registry.inc(f'{self.name}_total', outcome=self.outcome)
+        registry.mark(self.name, self.outcome)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish('error' if exc_type is not None else None)
+        return False
+
+
+def span(name: str) -> Span:
+    return Span(name)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/') not in ('', '/metrics'):
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: Optional[str] = METRICS_PORT) -> None:
+    """Serve ``/metrics`` in Prometheus text format on ``port``, once per process."""
+    global _server
+    if not port or _server is not None:
+        return
+    with _server_lock:
+        if _server is not None:
+            return
+        _server = ThreadingHTTPServer(('0.0.0.0', int(port)), _MetricsHandler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True).start()
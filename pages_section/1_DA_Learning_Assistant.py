@@ -1,23 +1,50 @@
+import os
+import hashlib
+import json
+
 import streamlit as st
 import streamlit.components.v1 as components
-import json
 from streamlit_theme import st_theme
 
-# Get theme and background color with fallback
-theme = st_theme()
-background_color = theme["backgroundColor"] if theme else "#0e1117", # Default to white
+FLOWISE_EMBED_CDN_URL = "https://cdn.jsdelivr.net/npm/flowise-embed/dist/web.js"
+# Vendored at image build time (see Dockerfile), served by Streamlit static file serving
+FLOWISE_EMBED_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "flowise-embed", "web.js"
+)
+
+@st.cache_resource
+def get_embed_bundle_url():
+    if not os.path.exists(FLOWISE_EMBED_PATH):
+        return None
+    # Content hash in the URL, so the bundle can be cached for a long time. Any ?v= argument makes
+    # Streamlit's (tornado) static handler send Cache-Control: max-age=315360000 itself, so this
+    # holds for the plain app service too; deploy/nginx.conf only adds "immutable" on top
+    with open(FLOWISE_EMBED_PATH, "rb") as f:
+        version = hashlib.sha256(f.read()).hexdigest()[:12]
+    base_path = st.get_option("server.baseUrlPath").strip("/")
+    prefix = f"/{base_path}" if base_path else ""
+    return f"{prefix}/app/static/flowise-embed/web.js?v={version}"
 
-# Create chatflow config
-chatflow_config = json.dumps({
-    "sessionId": st.session_state.get('session_id', ''),  # Using .get() for safety
-    "analytics": {
-        "langFuse": {
-            "userId": st.session_state.get('username', '')  # Using .get() for safety
+# The theme component only needs to report once per session
+if st.session_state.get('embed_background_color') is None:
+    theme = st_theme()
+    if theme:
+        st.session_state['embed_background_color'] = theme["backgroundColor"]
+background_color = st.session_state.get('embed_background_color') or "#0e1117"
+
+@st.cache_data(max_entries=1024)
+def build_flowise_html(background_color, session_id, username, bundle_url):
+    # Create chatflow config
+    chatflow_config = json.dumps({
+        "sessionId": session_id,
+        "analytics": {
+            "langFuse": {
+                "userId": username
+            }
         }
-    }
-})
+    })
 
-flowise_html = f"""
+    return f"""
 <!DOCTYPE html>
 <html>
 <head>
@@ -45,8 +72,25 @@ flowise_html = f"""
         <flowise-fullchatbot></flowise-fullchatbot>
     </div>
     <script type="module">
-        import Chatbot from "https://cdn.jsdelivr.net/npm/flowise-embed/dist/web.js"
-        
+        // Vendored bundle when available, jsDelivr otherwise
+        async function loadChatbot() {{
+            const bundleUrl = {json.dumps(bundle_url)};
+            if (bundleUrl) {{
+                try {{
+                    // Streamlit serves static .js as text/plain, which browsers refuse to import directly
+                    const response = await fetch(bundleUrl);
+                    if (response.ok) {{
+                        const blob = new Blob([await response.text()], {{ type: 'text/javascript' }});
+                        return (await import(URL.createObjectURL(blob))).default;
+                    }}
+                }} catch (e) {{
+                    console.warn('Vendored flowise-embed failed to load, using the CDN', e);
+                }}
+            }}
+            return (await import("{FLOWISE_EMBED_CDN_URL}")).default;
+        }}
+        const Chatbot = await loadChatbot();
+
         function initChat() {{
             // Get the actual viewport height
             const vh = window.innerHeight;
@@ -91,17 +135,33 @@ flowise_html = f"""
             }})
         }}
 
-        // Initialize on load and resize
+        // Initialize on load, and again only once resizing has settled
         initChat();
-        window.addEventListener('resize', initChat);
+        let resizeTimer;
+        let lastSize = [window.innerWidth, window.innerHeight];
+        window.addEventListener('resize', () => {{
+            clearTimeout(resizeTimer);
+            resizeTimer = setTimeout(() => {{
+                const size = [window.innerWidth, window.innerHeight];
+                if (size[0] !== lastSize[0] || size[1] !== lastSize[1]) {{
+                    lastSize = size;
+                    initChat();
+                }}
+            }}, 250);
+        }});
 
-        // Send height to Streamlit
-        window.addEventListener('load', function() {{
+        // Send height to Streamlit, load may already have fired while the bundle was imported
+        function sendFrameHeight() {{
             window.parent.postMessage({{
                 type: 'setFrameHeight',
                 height: window.innerHeight
             }}, '*');
-        }});
+        }}
+        if (document.readyState === 'complete') {{
+            sendFrameHeight();
+        }} else {{
+            window.addEventListener('load', sendFrameHeight);
+        }}
     </script>
 </body>
 </html>
@@ -118,4 +178,10 @@ js_code = """
 
 # Combine the components
 st.markdown(js_code, unsafe_allow_html=True)
+flowise_html = build_flowise_html(
+    background_color,
+    st.session_state.get('session_id', ''),  # Using .get() for safety
+    st.session_state.get('username', ''),
+    get_embed_bundle_url()
+)
 components.html(flowise_html, height=650, width=None, scrolling=False)
\ No newline at end of file
@@ -1,7 +1,10 @@
 import os
+from collections import OrderedDict
+
 import streamlit as st
-from flowise import Flowise, PredictionData
-import json
+from file_uploads import UPLOAD_ALLOWED_TYPES, UploadRejected, prepare_uploads, unsent_files
+from pages_section.flowise_test import Flowise, FlowiseClientOptions, PredictionData
+from sse import TokenEvent
 
 # Flowise app base url
 base_url = os.environ.get('FLOWISE_BASE_URL')
@@ -14,21 +17,30 @@ flow_id = os.environ.get("FLOW_ID")
 st.title("💬 Flowise Streamlit Chat")
 st.write("This is a simple chatbot that uses Flowise Python SDK")
 
-# Create options object with base_url
-class Options:
-    def __init__(self, base_url):
-        self.base_url = base_url
+# Create a Flowise client once per process so its connection pool and
+# streaming capability cache survive reruns
+@st.cache_resource
+def get_client():
+    return Flowise(FlowiseClientOptions(base_url, api_key))
 
-# Create a Flowise client with options object
-client = Flowise(Options(base_url))  
-if api_key:
-    client.api_key = api_key
+client = get_client()
 
 # Create a session state variable to store the chat messages. This ensures that the
 # messages persist across reruns.
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Files attached to the next question only, encoded once per session per distinct file
+uploaded_files = st.sidebar.file_uploader("Attach files", type=UPLOAD_ALLOWED_TYPES, accept_multiple_files=True)
+sent_upload_ids = st.session_state.setdefault('template_sent_upload_ids', set())
+new_files = unsent_files(uploaded_files, sent_upload_ids)
+try:
+    uploads = prepare_uploads(new_files, st.session_state.setdefault('upload_cache', OrderedDict()))
+except UploadRejected as e:
+    st.sidebar.error(str(e))
+    uploads = []
+    new_files = []
+
 # Display the existing chat messages via `st.chat_message`.
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -47,14 +59,17 @@ def generate_response(prompt: str):
                     }
                 }
             },
-            streaming=True
+            streaming=True,
+            uploads=uploads
         )
     )
 
-    for chunk in completion:
-        parsed_chunk = json.loads(chunk)
-        if parsed_chunk['event'] == 'token' and parsed_chunk['data'] != '':
-            yield str(parsed_chunk['data'])  # Yield only the new chunk
+    for event in completion:
+        if isinstance(event, TokenEvent) and event.data:
+            yield str(event.data)  # Yield only the new chunk
+        elif isinstance(event, dict):
+            # Chatflow doesn't stream, the whole answer arrives at once
+            yield event.get('text', '')
 
 # Create a chat input field
 if prompt := st.chat_input("What is up?"):
@@ -70,4 +85,6 @@ if prompt := st.chat_input("What is up?"):
             response += chunk  # Accumulate chunks
             response_placeholder.markdown(response)  # Update placeholder with accumulated response
     
-    st.session_state.messages.append({"role": "assistant", "content": response})
\ No newline at end of file
+    st.session_state.messages.append({"role": "assistant", "content": response})
+    if response:
+        sent_upload_ids.update(f.file_id for f in new_files)
\ No newline at end of file
@@ -1,6 +1,6 @@
 import os
 import streamlit as st
-from Home import login,load_flowise_chat_screen, generate_custom_api_response
+from core import login, load_flowise_chat_screen, generate_custom_api_response
 import uuid
 
 # Main content
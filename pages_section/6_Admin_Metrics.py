@@ -0,0 +1,48 @@
+import time
+import streamlit as st
+import metrics
+from core import is_admin
+
+if not is_admin():
+    st.error("This page is only available to admins.")
+    st.stop()
+
+st.title("📈 DALA Metrics")
+st.caption("In-process timings for this replica. Durations are histogram bucket upper bounds, in seconds.")
+
+if st.button("Refresh"):
+    st.rerun()
+
+st.subheader("Latency and payload size")
+st.dataframe(
+    [
+        {
+            "metric": summary["name"],
+            "labels": ", ".join(f"{k}={v}" for k, v in summary["labels"].items()),
+            "count": summary["count"],
+            "mean": round(summary["mean"], 4),
+            "p50": summary["p50"],
+            "p95": summary["p95"],
+            "p99": summary["p99"],
+        }
+        for summary in metrics.registry.histogram_summaries()
+    ],
+    use_container_width=True,
+)
+
+st.subheader(f"Requests per minute (last {metrics.registry.rate_window_minutes} minutes)")
+st.dataframe(
+    [
+        {
+            "minute": time.strftime("%H:%M", time.localtime(row["minute"])),
+            "span": row["span"],
+            "outcome": row["outcome"],
+            "count": row["count"],
+        }
+        for row in metrics.registry.per_minute_rates()
+    ],
+    use_container_width=True,
+)
+
+with st.expander("Prometheus text"):
+    st.code(metrics.registry.render_prometheus(), language="text")
@@ -1,10 +1,44 @@
-import requests
-from typing import List, Dict, Optional, Generator
+import asyncio
+import time
+from typing import Any, AsyncIterator, List, Dict, Optional, Generator, Union
+
+import httpx
+
+from http_session import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_POOL_SIZE,
+    HTTP_READ_TIMEOUT,
+    get_http_session,
+)
+import metrics
+from conversation_history import HistoryWindow, build_summary_prompt
+from sse import FlowiseEvent, aiter_flowise_events, iter_flowise_events
+from user_cache import SingleFlightCache
+
+# Chatflows whose isStreaming capability is remembered per client
+STREAMING_CACHE_MAX_SIZE = 1024
 
 class FlowiseClientOptions:
-    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        streaming_cache_ttl: float = 300,
+        prefetch_chatflows: Optional[List[str]] = None,
+        history_window: Optional[HistoryWindow] = None,
+        summary_chatflow_id: Optional[str] = None
+    ):
         self.base_url = base_url or 'http://localhost:3000'
         self.api_key = api_key
+        # How long a chatflow's isStreaming capability is trusted before re-checking
+        self.streaming_cache_ttl = streaming_cache_ttl
+        # Chatflow IDs whose capability is probed eagerly when the client is built
+        self.prefetch_chatflows = prefetch_chatflows
+        # Token-budgeted window applied to PredictionData.history, HISTORY_TOKEN_BUDGET by default
+        self.history_window = history_window
+        # Chatflow used to summarise turns that fall out of the window (sync client only)
+        self.summary_chatflow_id = summary_chatflow_id
 
 
 
@@ -44,10 +78,38 @@ class PredictionData:
         self.uploads = uploads
 
 
+def build_prediction_payload(data: PredictionData, streaming: bool, history: Optional[List[IMessage]] = None) -> Dict:
+    # ``history`` is the already windowed data.history
+    if history is None:
+        history = data.history or []
+    payload = {
+        'chatflowId': data.chatflowId,
+        'question': data.question,
+        'overrideConfig': data.overrideConfig,
+        'chatId': data.chatId,
+        'history': [msg.__dict__ for msg in history],
+        'uploads': [upload.__dict__ for upload in (data.uploads or [])]
+    }
+    if streaming:
+        payload['streaming'] = data.streaming
+    return payload
+
+
 class Flowise:
     def __init__(self, options: FlowiseClientOptions = FlowiseClientOptions()):
         self.base_url = options.base_url
         self.api_key = options.api_key
+        self.session = get_http_session()
+        self.streaming_cache_ttl = options.streaming_cache_ttl
+        # When an entry expires, concurrent sessions wait on one probe instead of all sending one
+        self._streaming_cache = SingleFlightCache(ttl=options.streaming_cache_ttl, max_size=STREAMING_CACHE_MAX_SIZE)
+        self.summary_chatflow_id = options.summary_chatflow_id
+        self.history_window = options.history_window or HistoryWindow(
+            summarizer=self.summarize_history if options.summary_chatflow_id else None
+        )
+
+        for chatflow_id in options.prefetch_chatflows or []:
+            self.is_streaming_available(chatflow_id)
 
     def get_headers(self):
         headers = {'Content-Type': 'application/json'}
@@ -55,51 +117,191 @@ class Flowise:
             headers['Authorization'] = f'Bearer {self.api_key}'
         return headers
 
-    def create_prediction(self, data: PredictionData) -> Generator[str, None, None]:
-        # Step 1: Check if chatflow is available for streaming
-        chatflow_stream_url = f'{self.base_url}/api/v1/chatflows-streaming/{data.chatflowId}'
-        response = requests.get(chatflow_stream_url)
+    def is_streaming_available(self, chatflowId: str, refresh: bool = False) -> bool:
+        return self._streaming_cache.get(chatflowId, self._probe_streaming, refresh=refresh)
+
+    def _probe_streaming(self, chatflowId: str) -> bool:
+        chatflow_stream_url = f'{self.base_url}/api/v1/chatflows-streaming/{chatflowId}'
+        response = self.session.get(chatflow_stream_url, headers=self.get_headers())
+        response.raise_for_status()
+        return bool(response.json().get("isStreaming", False))
+
+    def summarize_history(self, previous_summary: Optional[str], messages: List[IMessage]) -> str:
+        response = self.session.post(
+            f'{self.base_url}/api/v1/prediction/{self.summary_chatflow_id}',
+            json={'question': build_summary_prompt(previous_summary, messages)},
+            headers=self.get_headers()
+        )
         response.raise_for_status()
-        
-        chatflow_stream_data = response.json()
-        is_streaming_available = chatflow_stream_data.get("isStreaming", False)
+        return response.json().get('text', '')
+
+    def invalidate_streaming_cache(self, chatflowId: Optional[str] = None):
+        self._streaming_cache.invalidate(chatflowId)
+
+    def create_prediction(self, data: PredictionData, refresh_capability: bool = False) -> Generator[Union[FlowiseEvent, Dict], None, None]:
+        span = metrics.span('flowise_create_prediction')
+        try:
+            for chunk in self._create_prediction(data, refresh_capability, span):
+                span.first_byte()
+                yield chunk
+        except GeneratorExit:
+            # Consumer stopped reading before the stream ended
+            span.set_outcome('cancelled')
+            raise
+        except Exception:
+            span.set_outcome('error')
+            raise
+        finally:
+            span.finish()
+
+    def _create_prediction(self, data: PredictionData, refresh_capability: bool, span: metrics.Span) -> Generator[Union[FlowiseEvent, Dict], None, None]:
+        # Step 1: Check if chatflow is available for streaming (cached per chatflow)
+        is_streaming_available = self.is_streaming_available(data.chatflowId, refresh=refresh_capability)
 
         prediction_url = f'{self.base_url}/api/v1/prediction/{data.chatflowId}'
+        # Older turns are trimmed (or summarised) so the payload stays bounded
+        history = self.history_window.select(data.history)
 
         # Step 2: Handle streaming prediction
         if is_streaming_available and data.streaming:
-            headers = {'Content-Type': 'application/json'}
-            prediction_payload = {
-                'chatflowId': data.chatflowId,
-                'question': data.question,
-                'overrideConfig': data.overrideConfig,
-                'chatId': data.chatId,
-                'streaming': data.streaming,
-                'history': [msg.__dict__ for msg in (data.history or [])],
-                'uploads': [upload.__dict__ for upload in (data.uploads or [])]
-            }
-
-            with requests.post(prediction_url, json=prediction_payload, stream=True) as r:
+            prediction_payload = build_prediction_payload(data, streaming=True, history=history)
+
+            with self.session.post(prediction_url, json=prediction_payload, headers=self.get_headers(), stream=True) as r:
                 r.raise_for_status()
-                buffer = ''
-                for line in r.iter_lines():
-                    if line:
-                        line_str = line.decode('utf-8')
-                        if line_str.startswith('data:'):
-                            event = line_str.replace('data:', '').strip()
-                            yield event
+                if not r.headers.get('Content-Type', '').startswith('text/event-stream'):
+                    # Cached capability no longer matches the chatflow, re-probe next time
+                    self.invalidate_streaming_cache(data.chatflowId)
+                    yield r.json()
+                    return
+                # Typed events, parsed once from the raw byte stream
+                yield from iter_flowise_events(r.iter_content(chunk_size=None))
 
         # Step 3: Handle non-streaming prediction
         else:
-            prediction_payload = {
-                'chatflowId': data.chatflowId,
-                'question': data.question,
-                'overrideConfig': data.overrideConfig,
-                'chatId': data.chatId,
-                'history': [msg.__dict__ for msg in (data.history or [])],
-                'uploads': [upload.__dict__ for upload in (data.uploads or [])]
-            }
-
-            response = requests.post(prediction_url, json=prediction_payload)
+            prediction_payload = build_prediction_payload(data, streaming=False, history=history)
+
+            response = self.session.post(prediction_url, json=prediction_payload, headers=self.get_headers())
             response.raise_for_status()
-            yield response.json()
\ No newline at end of file
+            span.set_size(len(response.content))
+            yield response.json()
+
+
+class AsyncFlowise:
+    def __init__(
+        self,
+        options: FlowiseClientOptions = FlowiseClientOptions(),
+        max_connections: int = HTTP_POOL_SIZE,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+        max_retries: int = HTTP_MAX_RETRIES
+    ):
+        self.base_url = options.base_url
+        self.api_key = options.api_key
+        self.streaming_cache_ttl = options.streaming_cache_ttl
+        self._streaming_cache: Dict[str, tuple] = {}
+        self._streaming_probes: Dict[str, asyncio.Future] = {}
+        self._prefetch_chatflows = options.prefetch_chatflows or []
+        # No summary chatflow by default, pass a HistoryWindow with a summarizer to get summaries here
+        self.history_window = options.history_window or HistoryWindow()
+
+        # One pooled keep-alive client shared by every prediction made through this instance
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=httpx.AsyncHTTPTransport(retries=max_retries)
+        )
+
+    async def __aenter__(self):
+        for chatflow_id in self._prefetch_chatflows:
+            await self.is_streaming_available(chatflow_id)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def get_headers(self):
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        return headers
+
+    async def is_streaming_available(self, chatflowId: str, refresh: bool = False) -> bool:
+        if not refresh:
+            entry = self._streaming_cache.get(chatflowId)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+
+        # Coroutines that miss together share one probe
+        probe = self._streaming_probes.get(chatflowId)
+        if probe is None:
+            probe = self._streaming_probes[chatflowId] = asyncio.ensure_future(self._probe_streaming(chatflowId))
+            probe.add_done_callback(lambda _: self._streaming_probes.pop(chatflowId, None))
+        # Shielded, so one cancelled caller does not cancel the probe for the others
+        return await asyncio.shield(probe)
+
+    async def _probe_streaming(self, chatflowId: str) -> bool:
+        chatflow_stream_url = f'{self.base_url}/api/v1/chatflows-streaming/{chatflowId}'
+        response = await self.client.get(chatflow_stream_url, headers=self.get_headers())
+        response.raise_for_status()
+        is_streaming = bool(response.json().get("isStreaming", False))
+
+        self._streaming_cache[chatflowId] = (time.monotonic() + self.streaming_cache_ttl, is_streaming)
+        return is_streaming
+
+    def invalidate_streaming_cache(self, chatflowId: Optional[str] = None):
+        if chatflowId is None:
+            self._streaming_cache.clear()
+        else:
+            self._streaming_cache.pop(chatflowId, None)
+
+    async def create_prediction(self, data: PredictionData, refresh_capability: bool = False) -> AsyncIterator[Union[FlowiseEvent, Dict]]:
+        is_streaming_available = await self.is_streaming_available(data.chatflowId, refresh=refresh_capability)
+
+        prediction_url = f'{self.base_url}/api/v1/prediction/{data.chatflowId}'
+        # Never waits on a summarizer, summaries are built on the window's own threads
+        history = self.history_window.select(data.history)
+
+        if is_streaming_available and data.streaming:
+            prediction_payload = build_prediction_payload(data, streaming=True, history=history)
+
+            async with self.client.stream('POST', prediction_url, json=prediction_payload, headers=self.get_headers()) as r:
+                r.raise_for_status()
+                if not r.headers.get('Content-Type', '').startswith('text/event-stream'):
+                    self.invalidate_streaming_cache(data.chatflowId)
+                    await r.aread()
+                    yield r.json()
+                    return
+                async for event in aiter_flowise_events(r.aiter_bytes()):
+                    yield event
+
+        else:
+            prediction_payload = build_prediction_payload(data, streaming=False, history=history)
+
+            response = await self.client.post(prediction_url, json=prediction_payload, headers=self.get_headers())
+            response.raise_for_status()
+            yield response.json()
+
+    async def predict(self, data: PredictionData) -> Any:
+        """Run one prediction to completion: the JSON reply, or the list of streamed events."""
+        chunks = [chunk async for chunk in self.create_prediction(data)]
+        if len(chunks) == 1 and isinstance(chunks[0], dict):
+            return chunks[0]
+        return chunks
+
+    async def gather_predictions(
+        self,
+        predictions: List[PredictionData],
+        concurrency: int = 10,
+        return_exceptions: bool = True
+    ) -> List[Any]:
+        """Run many predictions concurrently, at most ``concurrency`` in flight, results in input order."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(data: PredictionData):
+            async with semaphore:
+                return await self.predict(data)
+
+        return await asyncio.gather(*(run(data) for data in predictions), return_exceptions=return_exceptions)
@@ -1,4 +1,16 @@
-from flowise_test import Flowise, FlowiseClientOptions, PredictionData
+"""Manual check of the Flowise client against the live API.
+
+Run it from the repo root with ``python -m pages_section.test_streaming``,
+or directly as ``python test_streaming.py``.
+"""
+import os
+import sys
+
+if not __package__:
+    # Run as a file, the client imports modules from the repo root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pages_section.flowise_test import Flowise, FlowiseClientOptions, PredictionData
 
 def test_non_streaming():
     # Set the base URL and API key for the Flowise API
@@ -0,0 +1,92 @@
+import base64
+import gzip
+import json
+import os
+from typing import Dict, Iterable, Optional
+
+import metrics
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is used instead
+    zstandard = None
+
+# Fields of the Flowise response kept in ResponseJSON, sourceDocuments and agent traces are dropped
+RESPONSE_JSON_FIELDS = [
+    f.strip() for f in os.environ.get(
+        'RESPONSE_JSON_FIELDS',
+        'text,question,chatId,chatMessageId,sessionId,memoryType,cacheHit'
+    ).split(',') if f.strip()
+]
+# none, gzip or zstd: also keep the full response, compressed, under FULL_PAYLOAD_KEY
+RESPONSE_JSON_COMPRESSION = os.environ.get('RESPONSE_JSON_COMPRESSION', 'none').lower()
+
+FULL_PAYLOAD_KEY = '_full'
+GZIP_PREFIX = 'gz1:'
+ZSTD_PREFIX = 'zs1:'
+
+RATIO_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0)
+
+
+def project_response_json(response_json: Dict, fields: Iterable[str] = RESPONSE_JSON_FIELDS) -> Dict:
+    return {field: response_json[field] for field in fields if field in response_json}
+
+
+def compress_payload(data: Dict, compression: str = RESPONSE_JSON_COMPRESSION) -> str:
+    raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    if compression == 'zstd' and zstandard is not None:
+        return ZSTD_PREFIX + base64.b64encode(zstandard.ZstdCompressor(level=10).compress(raw)).decode('ascii')
+    return GZIP_PREFIX + base64.b64encode(gzip.compress(raw, compresslevel=9, mtime=0)).decode('ascii')
+
+
+def decompress_payload(encoded: str) -> Dict:
+    if encoded.startswith(GZIP_PREFIX):
+        raw = gzip.decompress(base64.b64decode(encoded[len(GZIP_PREFIX):]))
+    elif encoded.startswith(ZSTD_PREFIX):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to decode zstd-compressed ResponseJSON")
+        raw = zstandard.ZstdDecompressor().decompress(base64.b64decode(encoded[len(ZSTD_PREFIX):]))
+    else:
+        raise ValueError(f"Unknown ResponseJSON encoding: {encoded[:8]!r}")
+    return json.loads(raw)
+
+
+def encode_response_json(
+    response_json: Dict,
+    fields: Optional[Iterable[str]] = None,
+    compression: Optional[str] = None
+) -> str:
+    """Serialize a Flowise response for the ResponseJSON field and record the size reduction."""
+    fields = RESPONSE_JSON_FIELDS if fields is None else fields
+    compression = RESPONSE_JSON_COMPRESSION if compression is None else compression
+
+    stored = project_response_json(response_json, fields)
+    if compression in ('gzip', 'zstd'):
+        stored[FULL_PAYLOAD_KEY] = compress_payload(response_json, compression)
+    encoded = json.dumps(stored)
+
+    raw_size = len(json.dumps(response_json))
+    metrics.registry.observe('response_json_raw_bytes', raw_size, buckets=metrics.SIZE_BUCKETS)
+    metrics.registry.observe('response_json_stored_bytes', len(encoded), buckets=metrics.SIZE_BUCKETS)
+    if raw_size:
+        metrics.registry.observe('response_json_size_ratio', len(encoded) / raw_size, buckets=RATIO_BUCKETS)
+    return encoded
+
+
+def decode_response_json(value: Optional[str], full: bool = True) -> Optional[Dict]:
+    """Inverse of encode_response_json, also accepts the plain json.dumps records written before it.
+
+    With ``full=True`` the compressed full payload is returned when present,
+    otherwise the projected fields.
+    """
+    if not value:
+        return None
+    if value.startswith((GZIP_PREFIX, ZSTD_PREFIX)):
+        return decompress_payload(value)
+
+    data = json.loads(value)
+    if isinstance(data, dict) and FULL_PAYLOAD_KEY in data:
+        encoded_full = data.pop(FULL_PAYLOAD_KEY)
+        if full:
+            return decompress_payload(encoded_full)
+    return data
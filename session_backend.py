@@ -0,0 +1,204 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+try:
+    import redis
+except ImportError:  # only needed for SESSION_BACKEND=redis
+    redis = None
+
+# memory, sqlite or redis
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'memory').lower()
+SESSION_SQLITE_PATH = os.environ.get('SESSION_SQLITE_PATH', 'sessions.db')
+# Any server speaking the Redis protocol (Redis, Valkey, KeyDB, ...)
+SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+SESSION_TTL = int(os.environ.get('SESSION_TTL', 7 * 24 * 3600))
+# Expired sessions are swept on save at most this often (seconds); Redis expires them itself
+SESSION_PURGE_INTERVAL = float(os.environ.get('SESSION_PURGE_INTERVAL', 600))
+# Must be the same on every replica, otherwise cookies signed by one are rejected by the others
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '')
+
+_fallback_secret = secrets.token_bytes(32)
+
+
+def _secret() -> bytes:
+    return SESSION_SECRET.encode('utf-8') if SESSION_SECRET else _fallback_secret
+
+
+def new_session_key() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def sign_session_key(key: str) -> str:
+    digest = hmac.new(_secret(), key.encode('utf-8'), hashlib.sha256).digest()
+    return f"{key}.{base64.urlsafe_b64encode(digest[:18]).decode('ascii')}"
+
+
+def verify_session_token(token: Optional[str]) -> Optional[str]:
+    """Return the session key if ``token`` was signed with our secret, else None."""
+    if not token or '.' not in token:
+        return None
+    key = token.rsplit('.', 1)[0]
+    if hmac.compare_digest(sign_session_key(key), token):
+        return key
+    return None
+
+
+class SessionBackend(ABC):
+    """Stores each browser session's persisted state as a JSON document."""
+
+    purge_interval = SESSION_PURGE_INTERVAL
+    _last_purge = 0.0
+
+    @abstractmethod
+    def load(self, key: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def save(self, key: str, state: Dict, ttl: int = SESSION_TTL) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    def purge_expired(self) -> int:
+        """Remove expired sessions, return how many; stores that expire keys themselves keep this."""
+        return 0
+
+    def _purge_if_due(self) -> None:
+        # Every new visitor saves a session, so without this the store only ever grows
+        now = time.monotonic()
+        if now - self._last_purge >= self.purge_interval:
+            self._last_purge = now
+            self.purge_expired()
+
+
+class MemorySessionBackend(SessionBackend):
+    """Process-local store, state survives reruns and reconnects but not restarts."""
+
+    def __init__(self):
+        self._sessions: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def load(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._sessions[key]
+                return None
+            return json.loads(entry[1])
+
+    def save(self, key: str, state: Dict, ttl: int = SESSION_TTL) -> None:
+        data = json.dumps(state)
+        with self._lock:
+            self._sessions[key] = (time.monotonic() + ttl, data)
+        self._purge_if_due()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def purge_expired(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._sessions.items() if expires_at <= now]
+            for key in expired:
+                del self._sessions[key]
+        return len(expired)
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Sessions in a SQLite file, shared by replicas on the same host through a volume."""
+
+    def __init__(self, path: str = SESSION_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "key TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, key: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, key: str, state: Dict, ttl: int = SESSION_TTL) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (key, data, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(state), time.time() + ttl)
+        )
+        self._purge_if_due()
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        return self._conn().execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+class RedisSessionBackend(SessionBackend):
+    """Sessions in a Redis-protocol server, for replicas spread across hosts."""
+
+    def __init__(self, url: str = SESSION_REDIS_URL, prefix: str = 'dala:session:'):
+        if redis is None:
+            raise ImportError("SESSION_BACKEND=redis requires the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, key: str) -> Optional[Dict]:
+        data = self.client.get(self.prefix + key)
+        return json.loads(data) if data else None
+
+    def save(self, key: str, state: Dict, ttl: int = SESSION_TTL) -> None:
+        self.client.set(self.prefix + key, json.dumps(state), ex=ttl)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+
+def build_session_backend(kind: str = SESSION_BACKEND) -> SessionBackend:
+    if kind in ('sqlite', 'redis') and not SESSION_SECRET:
+        # A per-process secret would reject cookies signed by another replica, or before a restart
+        raise ValueError(f"SESSION_BACKEND={kind} requires SESSION_SECRET, identical on every replica")
+    if kind == 'sqlite':
+        return SQLiteSessionBackend()
+    if kind == 'redis':
+        return RedisSessionBackend()
+    if kind == 'memory':
+        return MemorySessionBackend()
+    raise ValueError(f"Unknown SESSION_BACKEND: {kind}")
+
+
+_backend: Optional[SessionBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_session_backend() -> SessionBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = build_session_backend()
+    return _backend
@@ -0,0 +1,144 @@
+import json
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, List, Optional, Tuple
+
+
+class FlowiseEvent:
+    """A single Flowise stream event, with its ``data`` already JSON-decoded."""
+
+    event = 'message'
+
+    def __init__(self, data, event: Optional[str] = None):
+        self.data = data
+        if event is not None:
+            self.event = event
+
+    def __repr__(self):
+        return f'{type(self).__name__}(event={self.event!r}, data={self.data!r})'
+
+
+class TokenEvent(FlowiseEvent):
+    event = 'token'
+
+
+class SourceDocumentsEvent(FlowiseEvent):
+    event = 'sourceDocuments'
+
+
+class MetadataEvent(FlowiseEvent):
+    event = 'metadata'
+
+
+class EndEvent(FlowiseEvent):
+    event = 'end'
+
+
+class ErrorEvent(FlowiseEvent):
+    event = 'error'
+
+
+EVENT_TYPES = {cls.event: cls for cls in (TokenEvent, SourceDocumentsEvent, MetadataEvent, EndEvent, ErrorEvent)}
+
+
+class SSEParser:
+    """Incremental server-sent events parser working on raw byte chunks.
+
+    Chunks may split lines and events anywhere; complete events are returned
+    as ``(event_name, data)`` tuples, with multi-line ``data:`` fields joined by
+    newlines and decoded once per event.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._event = b''
+        self._data: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[Tuple[str, str]]:
+        self._buffer += chunk
+        events = []
+        buffer = self._buffer
+        start = 0
+
+        while True:
+            end = buffer.find(b'\n', start)
+            if end == -1:
+                break
+            line_end = end - 1 if end > start and buffer[end - 1] == 13 else end  # strip \r
+            if line_end == start:
+                event = self._dispatch()
+                if event is not None:
+                    events.append(event)
+            elif buffer[start] != 58:  # lines starting with ':' are comments
+                colon = buffer.find(b':', start, line_end)
+                if colon == -1:
+                    field, value_start = bytes(buffer[start:line_end]), line_end
+                else:
+                    field, value_start = bytes(buffer[start:colon]), colon + 1
+                    if value_start < line_end and buffer[value_start] == 32:
+                        value_start += 1
+                if field == b'data':
+                    self._data.append(bytes(buffer[value_start:line_end]))
+                elif field == b'event':
+                    self._event = bytes(buffer[value_start:line_end])
+                # id, retry and unknown fields carry nothing we use
+            start = end + 1
+
+        del buffer[:start]
+        return events
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """Dispatch an event left pending when the stream closed without a blank line."""
+        events = []
+        if self._buffer:
+            events.extend(self.feed(b'\n'))
+        event = self._dispatch()
+        if event is not None:
+            events.append(event)
+        return events
+
+    def _dispatch(self) -> Optional[Tuple[str, str]]:
+        if not self._data:
+            self._event = b''
+            return None
+        data = b'\n'.join(self._data).decode('utf-8')
+        name = self._event.decode('utf-8') or 'message'
+        self._event = b''
+        self._data = []
+        return name, data
+
+
+def to_flowise_event(name: str, data: str) -> FlowiseEvent:
+    if data == '[DONE]':
+        return EndEvent(data)
+
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        payload = data
+
+    # Flowise wraps each event as data: {"event": "...", "data": ...}
+    if name == 'message' and isinstance(payload, dict) and 'event' in payload:
+        name = payload['event']
+        payload = payload.get('data')
+
+    cls = EVENT_TYPES.get(name)
+    if cls is None:
+        return FlowiseEvent(payload, event=name)
+    return cls(payload)
+
+
+def iter_flowise_events(chunks: Iterable[bytes]) -> Iterator[FlowiseEvent]:
+    parser = SSEParser()
+    for chunk in chunks:
+        for name, data in parser.feed(chunk):
+            yield to_flowise_event(name, data)
+    for name, data in parser.flush():
+        yield to_flowise_event(name, data)
+
+
+async def aiter_flowise_events(chunks: AsyncIterable[bytes]) -> AsyncIterator[FlowiseEvent]:
+    parser = SSEParser()
+    async for chunk in chunks:
+        for name, data in parser.feed(chunk):
+            yield to_flowise_event(name, data)
+    for name, data in parser.flush():
+        yield to_flowise_event(name, data)
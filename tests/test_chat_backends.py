@@ -0,0 +1,39 @@
+import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from chat_backends import BackendCancelled, ChatBackend, HedgedRouter
+
+
+class FakeBackend(ChatBackend):
+    def __init__(self, name, latency):
+        self.name = name
+        self.latency = latency
+        self.calls = 0
+
+    def ask(self, question, conversation_id=None, on_token=None, cancel=None, uploads=None):
+        self.calls += 1
+        if cancel.wait(self.latency()):
+            raise BackendCancelled(self.name)
+        return {'text': self.name}
+
+
+def test_hedge_rate_stays_near_five_percent():
+    rng = random.Random(0)
+    # Exponential with a 10 ms mean, so the true p95 is about 30 ms
+    primary = FakeBackend('primary', lambda: rng.expovariate(100))
+    # Always wins a hedge, so every hedged primary is cancelled
+    secondary = FakeBackend('secondary', lambda: 0.0)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        router = HedgedRouter([primary, secondary], min_samples=20, default_hedge_delay=0.03, executor=executor)
+        router.stats['primary'].latencies = deque(maxlen=40)
+
+        for _ in range(150):
+            router.ask('q', {})
+        hedges_before = secondary.calls
+        for _ in range(150):
+            router.ask('q', {})
+
+    hedge_rate = (secondary.calls - hedges_before) / 150
+    assert hedge_rate < 0.12
+    assert router.hedge_delay(primary) > 0.02
@@ -0,0 +1,126 @@
+import pytest
+import requests
+
+from chat_store import AirtableSync, ChatStore
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f'{status} error', response=response)
+
+
+class FakeTable:
+    """Rejects any batch holding a record whose UserInput is 'bad' with a 422."""
+
+    def __init__(self):
+        self.created = []
+        self.batches = 0
+        self.outage = None
+
+    def batch_create(self, records):
+        self.batches += 1
+        if self.outage is not None:
+            raise http_error(self.outage)
+        if any(record['UserInput'] == 'bad' for record in records):
+            raise http_error(422)
+        self.created.extend(record['UserInput'] for record in records)
+        return records
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChatStore(str(tmp_path / 'chat_history.db'))
+
+
+@pytest.fixture
+def make_sync():
+    syncs = []
+
+    def make(store, table, batch_size=10):
+        # A long interval keeps the background worker out of the way, tests call sync_pending
+        sync = AirtableSync(store, table, batch_size=batch_size, interval=3600)
+        syncs.append(sync)
+        return sync
+
+    yield make
+    for sync in syncs:
+        sync.close(timeout=5)
+
+
+def add_rows(store, inputs):
+    return [store.append({'Timestamp': 1, 'Username': 'u', 'UserInput': text}) for text in inputs]
+
+
+def test_rejected_rows_are_dead_lettered_and_the_rest_synced(store, make_sync):
+    inputs = [f'q{i}' for i in range(25)]
+    inputs[3] = inputs[17] = 'bad'
+    ids = add_rows(store, inputs)
+    table = FakeTable()
+
+    synced = make_sync(store, table).sync_pending()
+
+    assert synced == 23
+    assert table.created == [text for text in inputs if text != 'bad']
+    assert [row['id'] for row in store.dead_letters('airtable')] == [ids[3], ids[17]]
+    assert all('422' in row['error'] for row in store.dead_letters('airtable'))
+    assert store.get_high_water_mark('airtable') == ids[-1]
+    assert store.pending('airtable') == 0
+
+
+def test_dead_lettered_row_at_the_end_still_advances_the_mark(store, make_sync):
+    ids = add_rows(store, ['q0', 'q1', 'bad'])
+    make_sync(store, FakeTable()).sync_pending()
+
+    assert store.get_high_water_mark('airtable') == ids[-1]
+    assert store.pending('airtable') == 0
+
+
+def test_transient_errors_keep_rows_for_the_next_attempt(store, make_sync):
+    add_rows(store, ['q0', 'q1'])
+    table = FakeTable()
+    sync = make_sync(store, table)
+
+    for status in (429, 503):
+        table.outage = status
+        with pytest.raises(requests.HTTPError):
+            sync.sync_pending()
+        assert store.pending('airtable') == 2
+    assert store.dead_letters('airtable') == []
+
+    table.outage = None
+    assert sync.sync_pending() == 2
+    assert table.created == ['q0', 'q1']
+
+
+def test_sync_resumes_from_the_high_water_mark(store, make_sync):
+    add_rows(store, ['q0', 'q1', 'q2'])
+    first = FakeTable()
+    make_sync(store, first, batch_size=2).sync_pending()
+
+    add_rows(store, ['q3', 'q4'])
+    # A new process picks up the same store, only rows after the mark are sent
+    second = FakeTable()
+    assert make_sync(store, second, batch_size=2).sync_pending() == 2
+
+    assert first.created == ['q0', 'q1', 'q2']
+    assert second.created == ['q3', 'q4']
+
+
+def test_failed_batch_does_not_move_the_mark_past_earlier_batches(store, make_sync):
+    ids = add_rows(store, ['q0', 'q1', 'q2', 'q3'])
+    table = FakeTable()
+    sync = make_sync(store, table, batch_size=2)
+    original = table.batch_create
+
+    def fail_second_batch(records):
+        if table.batches == 1:
+            table.outage = 503
+        return original(records)
+
+    table.batch_create = fail_second_batch
+    with pytest.raises(requests.HTTPError):
+        sync.sync_pending()
+
+    assert table.created == ['q0', 'q1']
+    assert store.get_high_water_mark('airtable') == ids[1]
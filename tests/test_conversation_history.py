@@ -0,0 +1,73 @@
+import threading
+import time
+
+from conversation_history import HistoryWindow, message_tokens
+from pages_section.flowise_test import IMessage
+
+
+def conversation(count):
+    return [
+        IMessage(message=f"message {i:02d} " + "about the project data " * 20, type='userMessage' if i % 2 == 0 else 'apiMessage')
+        for i in range(count)
+    ]
+
+
+def wait_for_summary(window, timeout=2):
+    deadline = time.monotonic() + timeout
+    while window._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_window_fills_the_budget_past_the_step_boundary():
+    messages = conversation(16)
+    per_message = max(message_tokens(m) for m in messages)
+    window = HistoryWindow(token_budget=per_message * 9 + per_message // 2, cut_step=6)
+
+    assert window.select(messages) == messages[-9:]
+
+
+def test_select_does_not_wait_for_the_summarizer():
+    release = threading.Event()
+    calls = []
+
+    def summarizer(previous, messages):
+        calls.append(len(messages))
+        release.wait(5)
+        return 'the student asked about their project'
+
+    messages = conversation(16)
+    per_message = max(message_tokens(m) for m in messages)
+    window = HistoryWindow(token_budget=(per_message * 9 // 2) * 4 // 3 + 1, summarizer=summarizer, cut_step=6)
+    try:
+        started = time.monotonic()
+        first = window.select(messages)
+        assert time.monotonic() - started < 0.5
+        assert first == messages[-len(first):]
+    finally:
+        release.set()
+    wait_for_summary(window)
+
+    second = window.select(messages)
+    assert second[0].message == "Summary of the earlier conversation: the student asked about their project"
+    assert second[1:] == first
+    assert calls == [12]
+
+
+def test_latest_summary_is_used_while_the_next_one_is_built():
+    release = threading.Event()
+
+    def summarizer(previous, messages):
+        if previous is not None:
+            release.wait(5)
+        return f'summary of {len(messages)} more'
+
+    messages = conversation(22)
+    per_message = max(message_tokens(m) for m in messages)
+    window = HistoryWindow(token_budget=(per_message * 9 // 2) * 4 // 3 + 1, summarizer=summarizer, cut_step=6)
+    try:
+        window.select(messages[:16])
+        wait_for_summary(window)
+        history = window.select(messages)
+    finally:
+        release.set()
+    assert history[0].message == "Summary of the earlier conversation: summary of 12 more"
@@ -0,0 +1,85 @@
+import threading
+
+from chat_store import ChatStore
+from idempotency import DeferredInterrupt, SubmissionRegistry, make_idempotency_key
+
+
+class Rerun(BaseException):
+    """Stands in for Streamlit's RerunException."""
+
+
+def test_identical_submissions_in_flight_share_one_prediction():
+    registry = SubmissionRegistry()
+    key = make_idempotency_key('s1', 'Chat', 0, 'hello')
+    release = threading.Event()
+    calls = []
+
+    def predict():
+        calls.append(1)
+        release.wait(5)
+        return {'text': 'hi'}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.run(key, predict))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(duplicate for _, _, duplicate in results) == [False, True, True]
+    assert len({history_key for _, history_key, _ in results}) == 1
+    assert all(result == {'text': 'hi'} for result, _, _ in results)
+
+
+def test_interrupted_rendering_keeps_the_prediction_for_the_rerun():
+    registry = SubmissionRegistry()
+    key = make_idempotency_key('s1', 'Chat', 0, 'hello')
+    interrupt = DeferredInterrupt()
+    rendered = []
+
+    def render(text):
+        rendered.append(text)
+        raise Rerun()
+
+    def predict():
+        on_token = interrupt.wrap(render)
+        on_token('h')
+        on_token('hi')
+        return {'text': 'hi'}
+
+    first, history_key, duplicate = registry.run(key, predict)
+    assert isinstance(interrupt.exception, Rerun)
+    assert rendered == ['h']
+    assert (first, duplicate) == ({'text': 'hi'}, False)
+
+    def predict_again():
+        raise AssertionError('the rerun must not predict again')
+
+    assert registry.run(key, predict_again) == ({'text': 'hi'}, history_key, True)
+
+
+def test_failed_prediction_is_not_shared():
+    registry = SubmissionRegistry()
+    key = make_idempotency_key('s1', 'Chat', 0, 'hello')
+    assert registry.run(key, lambda: None)[0] is None
+    assert registry.run(key, lambda: {'text': 'hi'})[:1] == ({'text': 'hi'},)
+
+
+def test_repeat_after_an_answer_is_a_new_submission():
+    assert make_idempotency_key('s1', 'Chat', 0, 'hello') == make_idempotency_key('s1', 'Chat', 0, ' Hello ')
+    assert make_idempotency_key('s1', 'Chat', 0, 'hello') != make_idempotency_key('s1', 'Chat', 1, 'hello')
+
+
+def test_shared_prediction_is_saved_to_history_once(tmp_path):
+    registry = SubmissionRegistry()
+    store = ChatStore(str(tmp_path / 'chat_history.db'))
+    key = make_idempotency_key('s1', 'Chat', 0, 'hello')
+    record = {'Timestamp': 1, 'SessionID': 'flowise', 'Username': 'u', 'UserInput': 'hello', 'ResponseJSON': '{}'}
+
+    for _ in range(2):
+        _, history_key, _ = registry.run(key, lambda: {'text': 'hi'})
+        store.append(record, history_key)
+
+    assert len(store.history()) == 1
@@ -0,0 +1,44 @@
+import sqlite3
+
+import pytest
+
+import session_backend
+from session_backend import MemorySessionBackend, SQLiteSessionBackend, build_session_backend
+
+
+def test_memory_backend_sweeps_expired_sessions_on_save():
+    backend = MemorySessionBackend()
+    backend.purge_interval = 0
+    backend.save('old', {'logged_in': True}, ttl=-1)
+    backend.save('new', {'logged_in': True})
+
+    assert list(backend._sessions) == ['new']
+
+
+def test_sqlite_backend_sweeps_expired_sessions_on_save(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    backend = SQLiteSessionBackend(path)
+    backend.purge_interval = 0
+    backend.save('old', {'logged_in': True}, ttl=-1)
+    backend.save('new', {'logged_in': True})
+
+    keys = [row[0] for row in sqlite3.connect(path).execute('SELECT key FROM sessions')]
+    assert keys == ['new']
+    assert backend.load('new') == {'logged_in': True}
+
+
+def test_sweep_waits_for_the_purge_interval():
+    backend = MemorySessionBackend()
+    backend.purge_interval = 3600
+    backend.save('first', {})
+    backend.save('old', {}, ttl=-1)
+    backend.save('new', {})
+
+    assert 'old' in backend._sessions
+
+
+@pytest.mark.parametrize('kind', ['sqlite', 'redis'])
+def test_shared_backends_require_a_session_secret(monkeypatch, kind):
+    monkeypatch.setattr(session_backend, 'SESSION_SECRET', '')
+    with pytest.raises(ValueError, match='SESSION_SECRET'):
+        build_session_backend(kind)
@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+from sse import EndEvent, ErrorEvent, FlowiseEvent, MetadataEvent, SSEParser, TokenEvent, aiter_flowise_events, iter_flowise_events
+
+
+def parse(chunks):
+    parser = SSEParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events + parser.flush()
+
+
+def byte_chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_lines_split_across_chunks():
+    stream = b'event: token\ndata: hello\n\nevent: token\ndata: world\n\n'
+    expected = [('token', 'hello'), ('token', 'world')]
+    for size in range(1, len(stream) + 1):
+        assert parse(byte_chunks(stream, size)) == expected
+
+
+def test_crlf_line_endings():
+    stream = b'event: token\r\ndata: hi\r\n\r\ndata: there\r\n\r\n'
+    assert parse([stream]) == [('token', 'hi'), ('message', 'there')]
+    # \r and \n of one line ending in different chunks
+    assert parse(byte_chunks(stream, 1)) == [('token', 'hi'), ('message', 'there')]
+
+
+def test_multi_line_data_is_joined_with_newlines():
+    assert parse([b'data: first\ndata: second\ndata:third\n\n']) == [('message', 'first\nsecond\nthird')]
+
+
+def test_event_field_applies_to_one_event_only():
+    stream = b'event: metadata\ndata: {}\n\ndata: plain\n\n'
+    assert parse([stream]) == [('metadata', '{}'), ('message', 'plain')]
+
+
+def test_comments_and_events_without_data_are_skipped():
+    assert parse([b': keep-alive\n\nevent: ping\n\ndata: x\n\n']) == [('message', 'x')]
+
+
+def test_utf8_sequences_split_across_chunks():
+    text = 'Halo, apa kabar? 👋 ñ'
+    stream = f'data: {text}\n\n'.encode('utf-8')
+    for size in range(1, 8):
+        assert parse(byte_chunks(stream, size)) == [('message', text)]
+
+
+def test_event_without_trailing_blank_line_is_flushed():
+    assert parse([b'data: last']) == [('message', 'last')]
+
+
+FLOWISE_STREAM = b''.join(
+    f'data: {json.dumps(payload)}\n\n'.encode('utf-8') for payload in [
+        {'event': 'start', 'data': ''},
+        {'event': 'token', 'data': 'Hai '},
+        {'event': 'token', 'data': '👋'},
+        {'event': 'metadata', 'data': {'sessionId': 's1'}},
+        {'event': 'end', 'data': '[DONE]'},
+    ]
+)
+
+
+def check_flowise_events(events):
+    assert [type(event) for event in events] == [FlowiseEvent, TokenEvent, TokenEvent, MetadataEvent, EndEvent]
+    assert [event.data for event in events[1:3]] == ['Hai ', '👋']
+    assert events[3].data == {'sessionId': 's1'}
+
+
+def test_flowise_events_from_sync_chunks():
+    check_flowise_events(list(iter_flowise_events(byte_chunks(FLOWISE_STREAM, 5))))
+
+
+def test_flowise_events_from_async_chunks():
+    async def chunks():
+        for chunk in byte_chunks(FLOWISE_STREAM, 5):
+            yield chunk
+
+    async def collect():
+        return [event async for event in aiter_flowise_events(chunks())]
+
+    check_flowise_events(asyncio.run(collect()))
+
+
+def test_error_event_and_done_marker():
+    events = list(iter_flowise_events([b'event: error\ndata: "rate limited"\n\ndata: [DONE]\n\n']))
+    assert isinstance(events[0], ErrorEvent) and events[0].data == 'rate limited'
+    assert isinstance(events[1], EndEvent)
@@ -0,0 +1,50 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from tool_executor import ToolExecutor
+
+
+def tool_call(call_id, name, **arguments):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+
+
+def test_timed_out_tool_reports_an_error():
+    release = threading.Event()
+    executor = ToolExecutor(tool_map={'hang': lambda: release.wait(5)}, default_timeout=0.2)
+    try:
+        [result] = executor.execute([tool_call('1', 'hang')])
+    finally:
+        release.set()
+    assert 'timed out' in json.loads(result['output'])['error']
+
+
+def test_timed_out_tool_does_not_block_the_next_turn():
+    release = threading.Event()
+    executor = ToolExecutor(
+        tool_map={'hang': lambda: release.wait(5), 'echo': lambda text: text},
+        max_workers=1,
+        default_timeout=0.2
+    )
+    try:
+        executor.execute([tool_call('1', 'hang')])
+        started = time.monotonic()
+        [result] = executor.execute([tool_call('2', 'echo', text='hi')])
+        elapsed = time.monotonic() - started
+    finally:
+        release.set()
+    assert result == {'tool_call_id': '2', 'output': 'hi'}
+    assert elapsed < 0.2
+
+
+def test_tools_taking_a_timeout_get_the_time_left():
+    seen = {}
+
+    def search(query, timeout=None):
+        seen['timeout'] = timeout
+        return query
+
+    executor = ToolExecutor(tool_map={'search': search}, default_timeout=2)
+    executor.execute([tool_call('1', 'search', query='q')])
+    assert 0 < seen['timeout'] <= 2
@@ -0,0 +1,52 @@
+import threading
+
+from user_cache import SingleFlight, SingleFlightCache
+
+
+def concurrent_gets(cache, key, loader, count=5):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(key, loader))) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def slow_loader(release, calls):
+    def load(key):
+        calls.append(key)
+        release.wait(5)
+        return {'fields': {'Username': key}}
+    return load
+
+
+def test_concurrent_misses_share_one_load():
+    cache = SingleFlightCache(ttl=60, max_size=10)
+    release, calls = threading.Event(), []
+    threading.Timer(0.1, release.set).start()
+
+    results = concurrent_gets(cache, 'u', slow_loader(release, calls))
+
+    assert calls == ['u']
+    assert len(results) == 5
+    assert cache.get('u', lambda key: None) == {'fields': {'Username': 'u'}}
+
+
+def test_missing_records_are_not_cached():
+    cache = SingleFlightCache(ttl=60, max_size=10)
+    assert cache.get('u', lambda key: None) is None
+    assert cache.get('u', lambda key: {'fields': {}}) == {'fields': {}}
+
+
+def test_single_flight_shares_but_keeps_nothing():
+    lookups = SingleFlight()
+    release, calls = threading.Event(), []
+    threading.Timer(0.1, release.set).start()
+
+    concurrent_gets(lookups, 'u', slow_loader(release, calls))
+
+    assert calls == ['u']
+    assert not lookups._entries
+    lookups.get('u', slow_loader(release, calls))
+    assert calls == ['u', 'u']
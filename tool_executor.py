@@ -0,0 +1,194 @@
+import inspect
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional
+
+import metrics
+from tools import TOOL_MAP
+
+TOOL_MAX_WORKERS = int(os.environ.get('TOOL_MAX_WORKERS', 8))
+TOOL_TIMEOUT = float(os.environ.get('TOOL_TIMEOUT', 30))
+# Per-tool overrides, e.g. TOOL_TIMEOUTS='{"search_docs": 10}'
+TOOL_TIMEOUTS = json.loads(os.environ.get('TOOL_TIMEOUTS', '{}'))
+# Results are only cached for the tools listed here, and only while TOOL_CACHE_TTL > 0
+TOOL_CACHE_TTL = float(os.environ.get('TOOL_CACHE_TTL', 0))
+TOOL_CACHE_TOOLS = {t.strip() for t in os.environ.get('TOOL_CACHE_TOOLS', '').split(',') if t.strip()}
+TOOL_CACHE_MAX_SIZE = int(os.environ.get('TOOL_CACHE_MAX_SIZE', 1024))
+
+
+def format_output(output) -> str:
+    if isinstance(output, str):
+        return output
+    if output is None:
+        return ''
+    try:
+        return json.dumps(output)
+    except (TypeError, ValueError):
+        return str(output)
+
+
+def error_output(message: str) -> str:
+    return json.dumps({"error": message})
+
+
+@lru_cache(maxsize=None)
+def accepts_timeout(tool: Callable) -> bool:
+    try:
+        parameters = inspect.signature(tool).parameters
+    except (TypeError, ValueError):
+        return False
+    return 'timeout' in parameters
+
+
+class ToolExecutor:
+    """Runs every tool call of one model turn concurrently and returns all outputs together.
+
+    Each tool gets its own timeout, measured from when the turn started; a
+    tool that overruns reports an error output. Tools that take a ``timeout``
+    argument get the time left, so they can stop by themselves (e.g. as an
+    HTTP timeout). Each turn runs on its own pool, shut down when the turn
+    ends, so a tool that hangs anyway only keeps its own thread and never
+    delays a later turn. Identical calls within a turn run once.
+    """
+
+    def __init__(
+        self,
+        tool_map: Dict[str, Callable] = TOOL_MAP,
+        max_workers: int = TOOL_MAX_WORKERS,
+        default_timeout: float = TOOL_TIMEOUT,
+        timeouts: Optional[Dict[str, float]] = None,
+        cache_ttl: float = TOOL_CACHE_TTL,
+        cacheable_tools: Iterable[str] = TOOL_CACHE_TOOLS,
+        cache_max_size: int = TOOL_CACHE_MAX_SIZE
+    ):
+        self.tool_map = tool_map
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self.timeouts = dict(TOOL_TIMEOUTS if timeouts is None else timeouts)
+        self.cache_ttl = cache_ttl
+        self.cacheable_tools = set(cacheable_tools)
+        self.cache_max_size = cache_max_size
+        self._cache: Dict[tuple, tuple] = {}
+        self._cache_lock = threading.Lock()
+
+    def timeout_for(self, name: str) -> float:
+        return float(self.timeouts.get(name, self.default_timeout))
+
+    def _cache_get(self, key: tuple) -> Optional[str]:
+        if self.cache_ttl <= 0 or key[0] not in self.cacheable_tools:
+            return None
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._cache[key]
+                return None
+            return entry[1]
+
+    def _cache_put(self, key: tuple, output: str) -> None:
+        if self.cache_ttl <= 0 or key[0] not in self.cacheable_tools:
+            return
+        with self._cache_lock:
+            if len(self._cache) >= self.cache_max_size:
+                # Drop expired entries first, then the oldest
+                now = time.monotonic()
+                for k in [k for k, (expires_at, _) in self._cache.items() if expires_at <= now]:
+                    del self._cache[k]
+                while len(self._cache) >= self.cache_max_size:
+                    del self._cache[next(iter(self._cache))]
+            self._cache[key] = (time.monotonic() + self.cache_ttl, output)
+
+    def _run(self, name: str, arguments: Dict, deadline: float) -> str:
+        started = time.perf_counter()
+        if accepts_timeout(self.tool_map[name]) and 'timeout' not in arguments:
+            arguments = dict(arguments, timeout=max(0.0, deadline - time.monotonic()))
+        try:
+            return format_output(self.tool_map[name](**arguments))
+        finally:
+            metrics.registry.observe('tool_duration_seconds', time.perf_counter() - started, tool=name)
+
+    def execute(self, tool_calls) -> List[Dict]:
+        """Run OpenAI-style tool calls (``id``, ``function.name``, ``function.arguments``).
+
+        Returns ``[{"tool_call_id": ..., "output": ...}]`` in the order of
+        ``tool_calls``, ready for a single ``submit_tool_outputs``.
+        """
+        started = time.monotonic()
+        outputs: Dict[str, str] = {}
+        running: Dict[tuple, Dict] = {}
+        keys: Dict[str, tuple] = {}
+
+        for tool_call in tool_calls:
+            name = tool_call.function.name
+            try:
+                arguments = json.loads(tool_call.function.arguments or '{}')
+            except ValueError as e:
+                outputs[tool_call.id] = error_output(f"Invalid arguments for {name}: {str(e)}")
+                metrics.registry.inc('tool_calls_total', tool=name, outcome='error')
+                continue
+            if name not in self.tool_map:
+                outputs[tool_call.id] = error_output(f"Unknown tool: {name}")
+                metrics.registry.inc('tool_calls_total', tool=name, outcome='error')
+                continue
+
+            key = (name, json.dumps(arguments, sort_keys=True))
+            keys[tool_call.id] = key
+            if key in running:
+                continue
+            cached = self._cache_get(key)
+            if cached is not None:
+                outputs[tool_call.id] = cached
+                metrics.registry.inc('tool_calls_total', tool=name, outcome='cached')
+                del keys[tool_call.id]
+                continue
+            running[key] = arguments
+
+        results: Dict[tuple, str] = {}
+        if running:
+            pool = ThreadPoolExecutor(max_workers=min(self.max_workers, len(running)), thread_name_prefix='tool')
+            try:
+                futures = {
+                    key: pool.submit(self._run, key[0], arguments, started + self.timeout_for(key[0]))
+                    for key, arguments in running.items()
+                }
+                for key, future in futures.items():
+                    name = key[0]
+                    remaining = max(0.0, started + self.timeout_for(name) - time.monotonic())
+                    try:
+                        results[key] = future.result(timeout=remaining)
+                        self._cache_put(key, results[key])
+                        metrics.registry.inc('tool_calls_total', tool=name, outcome='ok')
+                    except FutureTimeoutError:
+                        # Drops it if it never started; a running tool cannot be interrupted
+                        future.cancel()
+                        results[key] = error_output(f"Tool {name} timed out after {self.timeout_for(name):g}s")
+                        metrics.registry.inc('tool_calls_total', tool=name, outcome='timeout')
+                    except Exception as e:
+                        results[key] = error_output(f"Tool {name} failed: {str(e)}")
+                        metrics.registry.inc('tool_calls_total', tool=name, outcome='error')
+            finally:
+                # Overrunning tools finish on their own threads, nothing waits for them
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        for tool_call_id, key in keys.items():
+            outputs[tool_call_id] = results[key]
+        metrics.registry.observe('tool_turn_seconds', time.monotonic() - started)
+        return [{"tool_call_id": tool_call.id, "output": outputs[tool_call.id]} for tool_call in tool_calls]
+
+
+_executor: Optional[ToolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_tool_executor() -> ToolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ToolExecutor()
+    return _executor
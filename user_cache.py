@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 300))
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', 2048))
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlightCache:
+    """TTL + LRU cache with single-flight loading: concurrent misses for a key make one load."""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, loader: Callable[[Hashable], Any], refresh: bool = False) -> Any:
+        """Return the cached value for ``key``, or ``loader(key)``; ``refresh`` skips the cached value."""
+        with self._lock:
+            entry = None if refresh else self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+
+            flight = self._inflight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+
+        if not is_leader:
+            # Another caller is already loading this key, wait for its answer
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = loader(key)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                # None is never cached, so a missing record is looked up again next time
+                if flight.error is None and flight.result is not None and self.max_size > 0:
+                    self._entries[key] = (time.monotonic() + self.ttl, flight.result)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+                del self._inflight[key]
+            flight.event.set()
+
+        return flight.result
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+class UserCache(SingleFlightCache):
+    """TTL + LRU cache of non-secret Users fields, loaded once per username at a time.
+
+    Unknown usernames are not cached so newly registered students can log in.
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL, max_size: int = USER_CACHE_MAX_SIZE):
+        super().__init__(ttl, max_size)
+
+
+class SingleFlight(SingleFlightCache):
+    """Concurrent loads of one key share a single call; nothing is kept once it returns."""
+
+    def __init__(self):
+        super().__init__(ttl=0, max_size=0)
+
+
+_user_cache = UserCache()
+# Password lookups, shared between simultaneous logins but never cached
+_login_lookups = SingleFlight()
+
+
+def get_user_cache() -> UserCache:
+    return _user_cache
+
+
+def get_login_lookups() -> SingleFlight:
+    return _login_lookups